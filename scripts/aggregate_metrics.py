@@ -8,6 +8,18 @@ from typing import Any
 REPORTS_DIR = Path("reports")
 PATTERN = "metrics_patchcore_*_*.json"  # e.g. metrics_patchcore_bottle_resnet18.json
 
+# Image-level decision metrics written by `metinspect eval` (absent in older JSONs).
+DECISION_KEYS = [
+    "image_ap",
+    "image_fpr_at_tpr95",
+    "image_best_f1",
+    "image_best_f1_thresh",
+    "escape_rate",
+    "false_reject_rate",
+    "review_rate",
+]
+CI_KEYS = ["image_auroc", "escape_rate", "false_reject_rate", "review_rate"]
+
 
 def _as_float(x: Any) -> float | None:
     if x is None:
@@ -64,6 +76,20 @@ def _extract_metrics(d: dict[str, Any]) -> tuple[float | None, float | None]:
     return img, pix
 
 
+def _extract_decision(d: dict[str, Any]) -> dict[str, float | None]:
+    out: dict[str, float | None] = {k: _as_float(d.get(k)) for k in DECISION_KEYS}
+    for k in CI_KEYS:
+        ci = d.get(f"{k}_ci")
+        ok = isinstance(ci, list) and len(ci) == 2
+        out[f"{k}_ci_low"] = _as_float(ci[0]) if ok else None
+        out[f"{k}_ci_high"] = _as_float(ci[1]) if ok else None
+    return out
+
+
+def _decision_fields() -> list[str]:
+    return DECISION_KEYS + [f"{k}_ci_{b}" for k in CI_KEYS for b in ("low", "high")]
+
+
 def main() -> int:
     files = sorted(REPORTS_DIR.glob(PATTERN))
     if not files:
@@ -106,6 +132,7 @@ def main() -> int:
                 "backbone": backbone,
                 "image_auroc": image_auroc,
                 "pixel_auroc": pixel_auroc,
+                **_extract_decision(data),
                 "metrics_file": p.as_posix(),
             }
         )
@@ -115,7 +142,14 @@ def main() -> int:
     with out_csv.open("w", newline="", encoding="utf-8") as f:
         w = csv.DictWriter(
             f,
-            fieldnames=["category", "backbone", "image_auroc", "pixel_auroc", "metrics_file"],
+            fieldnames=[
+                "category",
+                "backbone",
+                "image_auroc",
+                "pixel_auroc",
+                *_decision_fields(),
+                "metrics_file",
+            ],
         )
         w.writeheader()
         for r in sorted(rows, key=lambda x: (str(x["backbone"]), str(x["category"]))):
@@ -152,14 +186,18 @@ def main() -> int:
         )
 
     lines.append("\n## Per-category\n")
-    lines.append("| category | backbone | image_auroc | pixel_auroc |")
-    lines.append("|---|---|---:|---:|")
+    lines.append(
+        "| category | backbone | image_auroc | pixel_auroc | escape_rate | review_rate |"
+    )
+    lines.append("|---|---|---:|---:|---:|---:|")
     for r in sorted(rows, key=lambda x: (str(x["backbone"]), str(x["category"]))):
         cat = _fmt(r["category"])
         bb = _fmt(r["backbone"])
         img = _fmt(r["image_auroc"])
         pix = _fmt(r["pixel_auroc"])
-        lines.append(f"| {cat} | {bb} | {img} | {pix} |")
+        esc = _fmt(r["escape_rate"])
+        rev = _fmt(r["review_rate"])
+        lines.append(f"| {cat} | {bb} | {img} | {pix} | {esc} | {rev} |")
 
     out_md.write_text("\n".join(lines) + "\n", encoding="utf-8")
 
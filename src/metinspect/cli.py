@@ -1,6 +1,9 @@
 ﻿from __future__ import annotations
 
+import contextlib
+import heapq
 import json
+import math
 from pathlib import Path
 
 import cv2
@@ -9,14 +12,24 @@ import typer
 
 from metinspect.config import load_config
 from metinspect.data.mvtec import (
+    MvtecSample,
     index_test_split,
     iter_train_good,
     list_categories,
     validate_mvtec_root,
 )
-from metinspect.image_io import load_image_tensor, read_mask01, read_rgb, resize_rgb
-from metinspect.metrics import image_auroc, pixel_auroc
+from metinspect.image_io import (
+    load_image_tensor,
+    load_image_tensor_native,
+    read_mask01,
+    read_rgb,
+    resize_rgb,
+)
+from metinspect.metrics import BinnedAuroc, image_score_report
 from metinspect.models.patchcore import PatchCore
+from metinspect.models.shared_bank import ScoringPool
+from metinspect.report import DEFAULT_GROUP_BY, build_report
+from metinspect.runlog import RUN_LOG_NAME, append_run
 from metinspect.viz import save_overlay_figure
 
 app = typer.Typer(
@@ -27,6 +40,35 @@ app = typer.Typer(
 DEFAULT_CONFIG = Path("configs/default.yaml")
 
 
+def _upsample_map(score_map: np.ndarray, size: int) -> np.ndarray:
+    return cv2.resize(
+        score_map.astype(np.float32),
+        (size, size),
+        interpolation=cv2.INTER_LINEAR,
+    )
+
+
+def _read_mask(s: MvtecSample, size: int) -> np.ndarray:
+    if s.mask_path is None:
+        return np.zeros((size, size), dtype=np.uint8)
+    return read_mask01(s.mask_path, size)
+
+
+def _read_mask_on_grid(s: MvtecSample, grid_hw: tuple[int, int]) -> np.ndarray:
+    """Native-resolution mask pooled onto a coarser grid; any defect pixel marks its cell."""
+    if s.mask_path is None:
+        return np.zeros(grid_hw, dtype=np.uint8)
+    m = read_mask01(s.mask_path).astype(np.float32)
+    return (cv2.resize(m, grid_hw[::-1], interpolation=cv2.INTER_AREA) > 0).astype(np.uint8)
+
+
+def _alloc_maps(dump_maps: Path | None, n: int, map_hw: tuple[int, int]) -> np.ndarray:
+    if dump_maps is None:
+        return np.empty((n, *map_hw), dtype=np.float16)
+    dump_maps.parent.mkdir(parents=True, exist_ok=True)
+    return np.lib.format.open_memmap(dump_maps, mode="w+", dtype=np.float16, shape=(n, *map_hw))
+
+
 def _seed_everything(seed: int) -> None:
     import random
     random.seed(seed)
@@ -63,13 +105,38 @@ def train(
         f"Training PatchCore baseline on category={cfg.category} "
         f"with {len(train_paths)} train images"
     )
-    pc = PatchCore(backbone=backbone, image_size=cfg.image_size, device=cfg.device, nn_k=1)
+    pc = PatchCore(
+        backbone=backbone,
+        image_size=cfg.image_size,
+        device=cfg.device,
+        nn_k=1,
+        tile_overlap=cfg.tile_overlap if cfg.tiling_enabled else None,
+        n_shards=cfg.knn_shards,
+    )
 
-    tensors = [load_image_tensor(p, cfg.image_size) for p in train_paths]
-    pc.fit_from_tensors(tensors, max_patches=max_patches)
+    if pc.tiled:
+        typer.echo(f"Tiled training: {cfg.image_size}px tiles, overlap={cfg.tile_overlap}")
+        tensors = (t for p in train_paths for t in pc.iter_tiles(load_image_tensor_native(p)))
+    else:
+        tensors = (load_image_tensor(p, cfg.image_size) for p in train_paths)
+    pc.fit_from_tensors(
+        tensors,
+        max_patches=max_patches,
+        batch_size=cfg.tile_batch_size,
+        projection=cfg.projection,
+        proj_dim=cfg.proj_dim,
+        proj_variance=cfg.proj_variance,
+        proj_min_dim=cfg.proj_min_dim,
+    )
+    if pc.projection is not None:
+        ev = pc.projection.explained_variance
+        typer.echo(
+            f"Projection: {pc.projection.method} {pc.projection.in_dim} -> {pc.projection.dim}"
+            + (f" (explained variance {ev:.4f})" if ev is not None else "")
+        )
 
     model_path = cfg.reports_dir / "models" / f"patchcore_{cfg.category}_{backbone}.pt"
-    pc.save(model_path)
+    pc.save(model_path, mmap_bank=cfg.knn_mmap_bank)
     typer.echo(f"Saved model: {model_path}")
 
 
@@ -78,6 +145,18 @@ def eval(
     config: Path = typer.Option(DEFAULT_CONFIG, "--config", "-c"),
     backbone: str = typer.Option("resnet18", "--backbone"),
     gallery_n: int = typer.Option(12, "--gallery-n"),
+    n_boot: int = typer.Option(1000, "--n-boot", help="Bootstrap resamples for CIs (0 = off)."),
+    dump_maps: Path | None = typer.Option(
+        None,
+        "--dump-maps",
+        help="Write all score maps as one memory-mapped float16 .npy (+ index .json).",
+    ),
+    workers: int = typer.Option(
+        1, "--workers", help="Scoring processes sharing one memory bank (1 = in-process)."
+    ),
+    threads_per_worker: int = typer.Option(
+        0, "--threads-per-worker", help="Torch/BLAS threads per worker (0 = cores / workers)."
+    ),
 ) -> None:
     cfg = load_config(config)
     _seed_everything(cfg.seed)
@@ -87,45 +166,106 @@ def eval(
     if not model_path.exists():
         raise FileNotFoundError(f"Model not found: {model_path}. Run `metinspect train` first.")
 
-    pc = PatchCore.load(model_path, device=cfg.device)
     samples = index_test_split(cfg.mvtec_dir, cfg.category)
     if not samples:
         raise RuntimeError("No test samples found.")
 
-    y_true, y_score = [], []
-    masks, maps = [], []
-    gallery = []
-
-    typer.echo(f"Evaluating on category={cfg.category} with {len(samples)} test images")
-
-    for s in samples:
-        x = load_image_tensor(s.image_path, cfg.image_size)
-        img_score, score_map = pc.score(x)
-        heat = cv2.resize(
-            score_map.astype(np.float32),
-            (cfg.image_size, cfg.image_size),
-            interpolation=cv2.INTER_LINEAR,
-        )
-
-        if s.mask_path is None:
-            m01 = np.zeros((cfg.image_size, cfg.image_size), dtype=np.uint8)
+    # Everything from pool start-up to the end of scoring runs inside the stack, so a
+    # failure anywhere in between still shuts the pool down and frees the shared bank.
+    with contextlib.ExitStack() as stack:
+        paths = [s.image_path for s in samples]
+        if workers > 1:
+            pool = stack.enter_context(
+                ScoringPool(
+                    model_path,
+                    workers,
+                    device=cfg.device,
+                    threads_per_worker=threads_per_worker or None,
+                    tile_batch_size=cfg.tile_batch_size,
+                    n_shards=cfg.knn_shards,
+                )
+            )
+            tiled = pool.meta.tile_overlap is not None
+            feat_hw, model_size = pool.meta.feat_hw, pool.meta.image_size
+            bank_size, n_shards = pool.bank_size, pool.n_shards
+            projection = pool.meta.projection
+            results = pool.score_paths(paths)
+            typer.echo(f"Scoring with {pool.n_workers} workers x {pool.threads} threads")
         else:
-            m01 = read_mask01(s.mask_path, cfg.image_size)
-
-        y_true.append(int(s.label))
-        y_score.append(float(img_score))
-        masks.append(m01)
-        maps.append(heat)
-
-        img_rgb = resize_rgb(read_rgb(s.image_path), cfg.image_size)
-        title = f"{cfg.category}/{s.defect_type} score={img_score:.4f}"
-        gallery.append((float(img_score), img_rgb, heat, m01, title))
-
-    y_true_np = np.array(y_true, dtype=np.int32)
-    y_score_np = np.array(y_score, dtype=np.float32)
-
-    img_auc = image_auroc(y_true_np, y_score_np)
-    pix_auc = pixel_auroc(masks, maps)
+            pc = PatchCore.load(
+                model_path,
+                device=cfg.device,
+                n_shards=cfg.knn_shards,
+                knn_threads=cfg.knn_threads or None,
+            )
+            tiled = pc.tiled
+            feat_hw, model_size = pc.feat_hw, pc.image_size
+            bank_size, n_shards = pc.bank_size, pc.n_shards
+            projection = pc.projection
+            results = (pc.score_path(p, tile_batch_size=cfg.tile_batch_size) for p in paths)
+
+        n = len(samples)
+        # Maps are kept at the model's patch grid (float16) and only upsampled to
+        # image_size transiently. Tiled maps come back on the camera grid and are
+        # downsampled by the backbone stride, so their grid is fixed by the first image.
+        stride = model_size / feat_hw[0]
+        maps = None
+        y_true_np = np.empty(n, dtype=np.int32)
+        y_score_np = np.empty(n, dtype=np.float32)
+
+        typer.echo(f"Evaluating on category={cfg.category} with {n} test images")
+
+        if tiled:
+            typer.echo("Model was trained on tiles: scoring at native resolution")
+
+        # Tiled only: the gallery's top-N maps are kept at native resolution (min-heap
+        # on (score, -index), matching the stable ranking used for the gallery).
+        native: list[tuple[float, int, np.ndarray]] = []
+        for i, (s, (img_score, score_map)) in enumerate(zip(samples, results, strict=True)):
+            if tiled and gallery_n > 0:
+                entry = (float(img_score), -i, score_map.astype(np.float16))
+                if len(native) < gallery_n:
+                    heapq.heappush(native, entry)
+                else:
+                    heapq.heappushpop(native, entry)
+            if maps is None:
+                if tiled:
+                    h, w = score_map.shape
+                    map_hw = (math.ceil(h / stride), math.ceil(w / stride))
+                else:
+                    map_hw = feat_hw
+                maps = _alloc_maps(dump_maps, n, map_hw)
+            if tiled:
+                # The patch grid is all the information the backbone resolves; the
+                # gallery keeps its own native-resolution copies.
+                score_map = cv2.resize(score_map, map_hw[::-1], interpolation=cv2.INTER_AREA)
+
+            maps[i] = score_map
+            y_true_np[i] = int(s.label)
+            y_score_np[i] = float(img_score)
+
+    # Pixel AUROC: stream one map + mask at a time into a histogram. Tiled maps are
+    # scored on their patch grid against the native mask, so defects that vanish at
+    # image_size still count; whole-image maps are upsampled to the image_size mask.
+    pix_acc = BinnedAuroc(float(np.min(maps)), float(np.max(maps)))
+    for i, s in enumerate(samples):
+        if tiled:
+            pix_acc.update(_read_mask_on_grid(s, map_hw), maps[i].astype(np.float32))
+        else:
+            pix_acc.update(_read_mask(s, cfg.image_size), _upsample_map(maps[i], cfg.image_size))
+
+    report = image_score_report(
+        y_true_np,
+        y_score_np,
+        ok_thresh=cfg.ok_thresh,
+        nok_thresh=cfg.nok_thresh,
+        n_boot=n_boot,
+        seed=cfg.seed,
+    )
+    img_auc = report["image_auroc"]
+    pix_auc = pix_acc.compute()
+    lo, hi = report["score_min"], report["score_max"]
+    outside = [k for k in ("ok_thresh", "nok_thresh") if not lo <= report[k] <= hi]
 
     out_metrics = {
         "category": cfg.category,
@@ -133,22 +273,121 @@ def eval(
         "n_test": int(len(samples)),
         "image_auroc": float(img_auc),
         "pixel_auroc": float(pix_auc),
+        "tiled": tiled,
+        "pixel_auroc_grid": "patch_grid_native_mask" if tiled else "image_size",
+        "seed": cfg.seed,
+        "bank_size": bank_size,
+        "n_shards": n_shards,
+        "projection": "none" if projection is None else projection.method,
+        "proj_dim": 0 if projection is None else projection.dim,
+        # ok/nok thresholds are applied to un-normalized image scores
+        "score_scale": "raw_knn_distance",
+        **{k: v for k, v in report.items() if k != "image_auroc"},
     }
 
     cfg.reports_dir.mkdir(parents=True, exist_ok=True)
     metrics_path = cfg.reports_dir / f"metrics_patchcore_{cfg.category}_{backbone}.json"
     metrics_path.write_text(json.dumps(out_metrics, indent=2), encoding="utf-8")
+    append_run(
+        cfg.reports_dir / RUN_LOG_NAME,
+        {**out_metrics, "metrics_file": metrics_path.as_posix()},
+    )
 
     typer.echo(f"image AUROC: {img_auc:.4f}")
     typer.echo(f"pixel AUROC: {pix_auc:.4f}")
+    typer.echo(
+        f"escape rate: {report['escape_rate']:.4f}  "
+        f"false reject: {report['false_reject_rate']:.4f}  "
+        f"review: {report['review_rate']:.4f}"
+    )
+    if outside:
+        typer.echo(
+            f"Warning: {', '.join(outside)} outside the observed score range "
+            f"[{lo:.4f}, {hi:.4f}]; thresholds are on the raw kNN distance scale.",
+            err=True,
+        )
     typer.echo(f"Saved metrics: {metrics_path}")
 
-    gallery_sorted = sorted(gallery, key=lambda t: t[0], reverse=True)[: int(gallery_n)]
+    if dump_maps is not None:
+        maps.flush()
+        index = [
+            {
+                "image_path": s.image_path.as_posix(),
+                "label": int(s.label),
+                "defect_type": s.defect_type,
+                "score": float(y_score_np[i]),
+            }
+            for i, s in enumerate(samples)
+        ]
+        index_path = dump_maps.with_suffix(".json")
+        index_path.write_text(json.dumps(index, indent=2), encoding="utf-8")
+        typer.echo(f"Saved score maps: {dump_maps} ({index_path.name})")
+
     fig_dir = cfg.reports_dir / "figures" / f"gallery_{cfg.category}_{backbone}"
     fig_dir.mkdir(parents=True, exist_ok=True)
 
-    for i, (_sc, img_rgb, heat, m01, title) in enumerate(gallery_sorted):
-        out_path = fig_dir / f"{i:03d}.png"
-        save_overlay_figure(out_path, img_rgb, heat, m01, title)
-
+    native_maps = {-neg_i: m for _, neg_i, m in native}
+    native_index = []
+    top = np.argsort(-y_score_np, kind="stable")[: int(gallery_n)]
+    for rank, i in enumerate(top):
+        s = samples[i]
+        title = f"{cfg.category}/{s.defect_type} score={y_score_np[i]:.4f}"
+        if int(i) in native_maps:
+            # Camera pixel grid: one map pixel = pixel_size_mm.
+            native_map = native_maps[int(i)]
+            img_rgb = read_rgb(s.image_path)
+            heat = native_map.astype(np.float32)
+            if s.mask_path is None:
+                m01 = np.zeros(heat.shape, dtype=np.uint8)
+            else:
+                m01 = read_mask01(s.mask_path)
+            map_path = fig_dir / f"{rank:03d}_map.npy"
+            np.save(map_path, native_map)
+            native_index.append(
+                {
+                    "rank": rank,
+                    "map_file": map_path.name,
+                    "image_path": s.image_path.as_posix(),
+                    "defect_type": s.defect_type,
+                    "score": float(y_score_np[i]),
+                    "shape": list(native_map.shape),
+                    "pixel_size_mm": cfg.pixel_size_mm,
+                }
+            )
+        else:
+            img_rgb = resize_rgb(read_rgb(s.image_path), cfg.image_size)
+            heat = _upsample_map(maps[i], cfg.image_size)
+            m01 = _read_mask(s, cfg.image_size)
+        save_overlay_figure(fig_dir / f"{rank:03d}.png", img_rgb, heat, m01, title)
+
+    if native_index:
+        (fig_dir / "native_maps.json").write_text(
+            json.dumps(native_index, indent=2), encoding="utf-8"
+        )
     typer.echo(f"Saved gallery: {fig_dir}")
+
+
+@app.command()
+def report(
+    config: Path = typer.Option(DEFAULT_CONFIG, "--config", "-c"),
+    group_by: str = typer.Option(
+        "",
+        "--group-by",
+        help=(
+            "Comma-separated run-log fields to group on; others (e.g. seed) are averaged. "
+            f"Default: {','.join(DEFAULT_GROUP_BY)} (those present in the log)."
+        ),
+    ),
+    force: bool = typer.Option(False, "--force", help="Re-plot every category."),
+) -> None:
+    cfg = load_config(config)
+    keys = [k.strip() for k in group_by.split(",") if k.strip()]
+    res = build_report(cfg.reports_dir, keys or None, force=force)
+
+    typer.echo(f"Runs: {res.n_runs}  groups: {res.n_groups}")
+    typer.echo(f"Saved table: {res.table_csv}")
+    typer.echo(f"Saved summary: {res.summary_md}")
+    if res.replotted:
+        typer.echo(f"Re-plotted categories: {', '.join(res.replotted)}")
+    else:
+        typer.echo("Figures up to date.")
@@ -27,6 +27,58 @@ class Config:
     def image_size(self) -> int:
         return int(self.raw["mvtec"]["image_size"])
 
+    @property
+    def pixel_size_mm(self) -> float:
+        return float(self.raw.get("pixel_size_mm", 0.0))
+
+    @property
+    def ok_thresh(self) -> float:
+        return float(self.raw["decision"]["ok_thresh"])
+
+    @property
+    def nok_thresh(self) -> float:
+        return float(self.raw["decision"]["nok_thresh"])
+
+    @property
+    def tiling_enabled(self) -> bool:
+        return bool(self.raw.get("tiling", {}).get("enabled", False))
+
+    @property
+    def tile_overlap(self) -> float:
+        return float(self.raw.get("tiling", {}).get("overlap", 0.25))
+
+    @property
+    def tile_batch_size(self) -> int:
+        return int(self.raw.get("tiling", {}).get("batch_size", 8))
+
+    @property
+    def knn_shards(self) -> int:
+        return int(self.raw.get("knn", {}).get("n_shards", 1))
+
+    @property
+    def knn_threads(self) -> int:
+        return int(self.raw.get("knn", {}).get("n_threads", 0))
+
+    @property
+    def knn_mmap_bank(self) -> bool:
+        return bool(self.raw.get("knn", {}).get("mmap_bank", False))
+
+    @property
+    def projection(self) -> str:
+        return str(self.raw.get("projection", {}).get("method", "none"))
+
+    @property
+    def proj_dim(self) -> int:
+        return int(self.raw.get("projection", {}).get("dim", 0))
+
+    @property
+    def proj_variance(self) -> float:
+        return float(self.raw.get("projection", {}).get("variance", 0.99))
+
+    @property
+    def proj_min_dim(self) -> int:
+        return int(self.raw.get("projection", {}).get("min_dim", 32))
+
     @property
     def device(self) -> str:
         return str(self.raw["runtime"]["device"])
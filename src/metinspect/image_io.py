@@ -31,9 +31,14 @@ def load_image_tensor(path: Path, size: int) -> torch.Tensor:
     return to_tensor_1chw_float01(img)
 
 
-def read_mask01(path: Path, size: int) -> np.ndarray:
+def load_image_tensor_native(path: Path) -> torch.Tensor:
+    return to_tensor_1chw_float01(read_rgb(path))
+
+
+def read_mask01(path: Path, size: int | None = None) -> np.ndarray:
     m = cv2.imread(str(path), cv2.IMREAD_GRAYSCALE)
     if m is None:
         raise FileNotFoundError(f"Could not read mask: {path}")
-    m = cv2.resize(m, (size, size), interpolation=cv2.INTER_NEAREST)
+    if size is not None:
+        m = cv2.resize(m, (size, size), interpolation=cv2.INTER_NEAREST)
     return (m > 0).astype(np.uint8)
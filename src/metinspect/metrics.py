@@ -1,11 +1,199 @@
 ﻿from __future__ import annotations
 
+from dataclasses import dataclass
+from typing import Any
+
 import numpy as np
 from sklearn.metrics import roc_auc_score
 
 
+@dataclass
+class RocAnalysis:
+    """
+    ROC / PR curves over the distinct score thresholds, highest first.
+    A sample is predicted anomalous when score >= threshold.
+    """
+
+    thresholds: np.ndarray
+    fpr: np.ndarray
+    tpr: np.ndarray
+    precision: np.ndarray
+    auroc: float
+    average_precision: float
+    best_f1: float
+    best_f1_thresh: float
+
+    def fpr_at_tpr(self, target: float) -> float:
+        hit = np.flatnonzero(self.tpr >= target)
+        if hit.size == 0:
+            return float("nan")
+        return float(self.fpr[hit[0]])
+
+
+def _sort_desc(y_score: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Sort once, highest score first. Returns the order and tie-group starts."""
+    order = np.argsort(-y_score, kind="mergesort")
+    s = y_score[order]
+    starts = np.flatnonzero(np.r_[True, s[1:] != s[:-1]])
+    return order, starts
+
+
+def _auroc_from_group_counts(gp: np.ndarray, gn: np.ndarray) -> np.ndarray:
+    """
+    Batched AUROC from per-tie-group positive/negative counts (B, G), groups in
+    descending score order. Trapezoids over collapsed ties give 0.5 credit.
+    """
+    tp = np.cumsum(gp, axis=1, dtype=np.float64)
+    fp = np.cumsum(gn, axis=1, dtype=np.float64)
+    P = tp[:, -1:]
+    N = fp[:, -1:]
+    with np.errstate(divide="ignore", invalid="ignore"):
+        tpr = np.concatenate([np.zeros_like(P), tp / P], axis=1)
+        fpr = np.concatenate([np.zeros_like(N), fp / N], axis=1)
+    auc = np.sum(np.diff(fpr, axis=1) * (tpr[:, 1:] + tpr[:, :-1]), axis=1) / 2.0
+    auc[(P[:, 0] == 0) | (N[:, 0] == 0)] = np.nan
+    return auc
+
+
+def roc_analysis(y_true: np.ndarray, y_score: np.ndarray) -> RocAnalysis:
+    y_true = np.asarray(y_true).astype(bool)
+    y_score = np.asarray(y_score, dtype=np.float64)
+    order, starts = _sort_desc(y_score)
+    yt = y_true[order]
+
+    gp = np.add.reduceat(yt.astype(np.int64), starts)
+    gn = np.add.reduceat((~yt).astype(np.int64), starts)
+    tp = np.cumsum(gp).astype(np.float64)
+    fp = np.cumsum(gn).astype(np.float64)
+    P, N = tp[-1], fp[-1]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        tpr = tp / P
+        fpr = fp / N
+        precision = tp / (tp + fp)
+        f1 = 2.0 * precision * tpr / (precision + tpr)
+
+    auroc = float(_auroc_from_group_counts(gp[None, :], gn[None, :])[0])
+    recall_steps = np.diff(np.r_[0.0, tpr])
+    average_precision = float(np.sum(recall_steps * precision)) if P > 0 else float("nan")
+
+    f1 = np.nan_to_num(f1, nan=0.0)
+    i = int(np.argmax(f1))
+    return RocAnalysis(
+        thresholds=y_score[order][starts],
+        fpr=fpr,
+        tpr=tpr,
+        precision=precision,
+        auroc=auroc,
+        average_precision=average_precision,
+        best_f1=float(f1[i]),
+        best_f1_thresh=float(y_score[order][starts][i]),
+    )
+
+
+def _decision_rates_from_counts(
+    cp: np.ndarray, cn: np.ndarray, s_desc: np.ndarray, ok_thresh: float, nok_thresh: float
+) -> dict[str, np.ndarray]:
+    """
+    Three-way decision rates from per-sample counts (B, n) in descending score
+    order: OK if score < ok_thresh, NOK if score >= nok_thresh, review otherwise.
+    """
+    # number of samples with score >= t, via the single descending sort
+    k_ok = int(np.searchsorted(-s_desc, -ok_thresh, side="right"))
+    k_nok = int(np.searchsorted(-s_desc, -nok_thresh, side="right"))
+    zeros = np.zeros((cp.shape[0], 1), dtype=np.float64)
+    cum_p = np.concatenate([zeros, np.cumsum(cp, axis=1, dtype=np.float64)], axis=1)
+    cum_n = np.concatenate([zeros, np.cumsum(cn, axis=1, dtype=np.float64)], axis=1)
+    P = cum_p[:, -1]
+    N = cum_n[:, -1]
+
+    with np.errstate(divide="ignore", invalid="ignore"):
+        escape = (P - cum_p[:, k_ok]) / P
+        false_reject = cum_n[:, k_nok] / N
+        review = (cum_p[:, k_ok] - cum_p[:, k_nok] + cum_n[:, k_ok] - cum_n[:, k_nok]) / (P + N)
+    return {"escape_rate": escape, "false_reject_rate": false_reject, "review_rate": review}
+
+
+def image_score_report(
+    y_true: np.ndarray,
+    y_score: np.ndarray,
+    ok_thresh: float,
+    nok_thresh: float,
+    n_boot: int = 1000,
+    ci: float = 0.95,
+    tpr_target: float = 0.95,
+    seed: int = 0,
+) -> dict[str, Any]:
+    """
+    Image-level ROC/PR summary, OK/review/NOK decision rates at the configured
+    thresholds and percentile bootstrap CIs, all derived from one sort.
+
+    Thresholds are compared with y_score as given (no normalization); the
+    observed score_min / score_max are reported so callers can check that the
+    thresholds fall inside the score range.
+
+    Bootstrap resamples are drawn as a (n_boot, n) index array and turned into
+    per-sample multiplicity counts, so every replicate reuses the original
+    ordering instead of re-sorting.
+    """
+    y_true = np.asarray(y_true).astype(bool)
+    y_score = np.asarray(y_score, dtype=np.float64)
+    n = int(y_true.shape[0])
+    order, starts = _sort_desc(y_score)
+    s_desc = y_score[order]
+    yt = y_true[order]
+
+    ra = roc_analysis(y_true, y_score)
+    ones = np.ones((1, n), dtype=np.float64)
+    point = _decision_rates_from_counts(ones * yt, ones * ~yt, s_desc, ok_thresh, nok_thresh)
+
+    out: dict[str, Any] = {
+        "image_auroc": ra.auroc,
+        "image_ap": ra.average_precision,
+        f"image_fpr_at_tpr{int(round(tpr_target * 100))}": ra.fpr_at_tpr(tpr_target),
+        "image_best_f1": ra.best_f1,
+        "image_best_f1_thresh": ra.best_f1_thresh,
+        "ok_thresh": float(ok_thresh),
+        "nok_thresh": float(nok_thresh),
+        "score_min": float(s_desc[-1]) if n else float("nan"),
+        "score_max": float(s_desc[0]) if n else float("nan"),
+    }
+    for k, v in point.items():
+        out[k] = float(v[0])
+
+    if n_boot > 0 and n > 0:
+        rng = np.random.default_rng(seed)
+        idx = rng.integers(0, n, size=(n_boot, n))
+        # position of each original sample in the descending order
+        rank = np.empty(n, dtype=np.int64)
+        rank[order] = np.arange(n)
+        flat = (rank[idx] + (np.arange(n_boot) * n)[:, None]).ravel()
+        counts = np.bincount(flat, minlength=n_boot * n).reshape(n_boot, n).astype(np.float64)
+        cp = counts * yt
+        cn = counts * ~yt
+
+        boot = {
+            "image_auroc": _auroc_from_group_counts(
+                np.add.reduceat(cp, starts, axis=1), np.add.reduceat(cn, starts, axis=1)
+            )
+        }
+        boot.update(_decision_rates_from_counts(cp, cn, s_desc, ok_thresh, nok_thresh))
+
+        q = [(1.0 - ci) / 2.0 * 100.0, (1.0 + ci) / 2.0 * 100.0]
+        for k, v in boot.items():
+            if np.all(np.isnan(v)):
+                out[f"{k}_ci"] = [float("nan"), float("nan")]
+            else:
+                lo, hi = np.nanpercentile(v, q)
+                out[f"{k}_ci"] = [float(lo), float(hi)]
+        out["bootstrap_n"] = int(n_boot)
+        out["bootstrap_ci"] = float(ci)
+
+    return out
+
+
 def image_auroc(y_true: np.ndarray, y_score: np.ndarray) -> float:
-    return float(roc_auc_score(y_true, y_score))
+    return roc_analysis(y_true, y_score).auroc
 
 
 def pixel_auroc(y_true_masks: list[np.ndarray], y_score_maps: list[np.ndarray]) -> float:
@@ -14,3 +202,32 @@ def pixel_auroc(y_true_masks: list[np.ndarray], y_score_maps: list[np.ndarray])
     if len(np.unique(yt)) < 2:
         return float("nan")
     return float(roc_auc_score(yt, ys))
+
+
+class BinnedAuroc:
+    """
+    Streaming AUROC for pixel scores. Scores are histogrammed into n_bins over
+    [lo, hi] per class, so memory is O(n_bins) regardless of how many maps are
+    fed in. Pairs falling in the same bin count as ties; with the default
+    resolution the difference to the exact value is negligible.
+    """
+
+    def __init__(self, lo: float, hi: float, n_bins: int = 1 << 16) -> None:
+        self.lo = float(lo)
+        self.n_bins = int(n_bins)
+        span = float(hi) - self.lo
+        self.scale = (self.n_bins - 1) / span if span > 0 else 0.0
+        self.pos = np.zeros(self.n_bins, dtype=np.int64)
+        self.neg = np.zeros(self.n_bins, dtype=np.int64)
+
+    def update(self, y_true: np.ndarray, y_score: np.ndarray) -> None:
+        yt = y_true.reshape(-1).astype(bool)
+        b = ((y_score.reshape(-1).astype(np.float64) - self.lo) * self.scale).astype(np.int64)
+        np.clip(b, 0, self.n_bins - 1, out=b)
+        self.pos += np.bincount(b[yt], minlength=self.n_bins)
+        self.neg += np.bincount(b[~yt], minlength=self.n_bins)
+
+    def compute(self) -> float:
+        if self.pos.sum() == 0 or self.neg.sum() == 0:
+            return float("nan")
+        return float(_auroc_from_group_counts(self.pos[None, ::-1], self.neg[None, ::-1])[0])
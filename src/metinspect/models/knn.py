@@ -0,0 +1,171 @@
+from __future__ import annotations
+
+from collections.abc import Sequence
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+from threadpoolctl import ThreadpoolController
+
+# Upper bound on elements of the (queries x bank) distance block held at once.
+_MAX_BLOCK = 1 << 24
+# Queries per block once the bank is too large for whole-bank blocks; the bank is
+# then streamed in row chunks so the block size stays at _MAX_BLOCK.
+_MIN_QUERY_BLOCK = 256
+
+
+def squared_norms(bank: np.ndarray) -> np.ndarray:
+    return np.einsum("ij,ij->i", bank, bank, dtype=np.float32)
+
+
+def _top_k(d: np.ndarray, k: int) -> np.ndarray:
+    if k == 1:
+        return np.argmin(d, axis=1)[:, None]
+    j = np.argpartition(d, k - 1, axis=1)[:, :k]
+    return np.take_along_axis(j, np.argsort(np.take_along_axis(d, j, 1), axis=1), 1)
+
+
+def _merge_top_k(d: np.ndarray, idx: np.ndarray, k: int) -> tuple[np.ndarray, np.ndarray]:
+    """Global top-k of concatenated candidate lists (distances and bank indices)."""
+    j = _top_k(d, k)
+    return np.take_along_axis(d, j, 1), np.take_along_axis(idx, j, 1)
+
+
+class BruteKnn:
+    """
+    Exact Euclidean kNN over a dense bank via ||q||^2 - 2 q.b + ||b||^2.
+
+    Distances are computed in (query block x bank chunk) tiles of at most
+    _MAX_BLOCK elements with a running top-k, so each query block streams the
+    bank once regardless of its size.
+
+    Unlike sklearn's NearestNeighbors it never copies the bank, so it can sit on
+    top of shared or memory-mapped arrays. Mirrors the `kneighbors` interface
+    PatchCore uses.
+    """
+
+    def __init__(
+        self, bank: np.ndarray, sq_norms: np.ndarray | None = None, n_neighbors: int = 1
+    ) -> None:
+        # asarray drops np.memmap subclassing without copying.
+        self.bank = np.asarray(bank)
+        self.sq_norms = squared_norms(self.bank) if sq_norms is None else np.asarray(sq_norms)
+        self.n_neighbors = n_neighbors
+
+    def kneighbors(
+        self, X: np.ndarray, n_neighbors: int | None = None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        k = int(n_neighbors or self.n_neighbors)
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        n_bank = int(self.bank.shape[0])
+        if k > n_bank:
+            raise ValueError(f"n_neighbors={k} exceeds bank size {n_bank}")
+
+        n_query = int(X.shape[0])
+        q_step = max(1, min(n_query, max(_MIN_QUERY_BLOCK, _MAX_BLOCK // n_bank)))
+        b_step = max(k, _MAX_BLOCK // q_step)
+
+        dists = np.empty((n_query, k), dtype=np.float32)
+        idx = np.empty((n_query, k), dtype=np.int64)
+        for i in range(0, n_query, q_step):
+            q = X[i : i + q_step]
+            q_norms = squared_norms(q)
+            d, j = self._block(q, q_norms, 0, b_step, k)
+            for b in range(b_step, n_bank, b_step):
+                d_b, j_b = self._block(q, q_norms, b, b + b_step, k)
+                d, j = _merge_top_k(
+                    np.concatenate([d, d_b], axis=1), np.concatenate([j, j_b], axis=1), k
+                )
+            dists[i : i + q_step] = np.sqrt(d)
+            idx[i : i + q_step] = j
+        return dists, idx
+
+    def _block(
+        self, q: np.ndarray, q_norms: np.ndarray, start: int, stop: int, k: int
+    ) -> tuple[np.ndarray, np.ndarray]:
+        """Squared distances and bank indices of the top-k within bank[start:stop]."""
+        bank = self.bank[start:stop]
+        d2 = q @ bank.T
+        d2 *= -2.0
+        d2 += self.sq_norms[None, start:stop]
+        d2 += q_norms[:, None]
+        np.maximum(d2, 0.0, out=d2)
+
+        j = _top_k(d2, min(k, int(bank.shape[0])))
+        return np.take_along_axis(d2, j, 1), j + start
+
+
+class ShardedKnn:
+    """
+    Exact kNN over a bank split into shards. Each shard is searched with
+    BruteKnn on a thread pool (the matmul releases the GIL), and the per-shard
+    top-k lists are merged into the global top-k. While shards run in parallel
+    the BLAS pool is limited to its current size // n_threads, so the process
+    stays at its thread budget. Shards can be views of one array, shared memory
+    or np.load(..., mmap_mode="r") files.
+    """
+
+    def __init__(
+        self,
+        shards: Sequence[tuple[np.ndarray, np.ndarray | None]],
+        n_neighbors: int = 1,
+        n_threads: int | None = None,
+    ) -> None:
+        self.n_neighbors = n_neighbors
+        self.shards: list[tuple[BruteKnn, int]] = []
+        offset = 0
+        for bank, sq_norms in shards:
+            if bank.shape[0] > 0:
+                self.shards.append((BruteKnn(bank, sq_norms, n_neighbors), offset))
+            offset += int(bank.shape[0])
+        if not self.shards:
+            raise ValueError("ShardedKnn needs at least one non-empty shard.")
+        self.n_bank = offset
+        self.n_threads = int(n_threads or len(self.shards))
+        self._executor: ThreadPoolExecutor | None = None
+        self._blas: ThreadpoolController | None = None
+
+    @staticmethod
+    def from_bank(
+        bank: np.ndarray,
+        n_shards: int,
+        sq_norms: np.ndarray | None = None,
+        n_neighbors: int = 1,
+        n_threads: int | None = None,
+    ) -> ShardedKnn:
+        """Split an in-memory bank into n_shards contiguous views (no copy)."""
+        bounds = np.linspace(0, bank.shape[0], int(n_shards) + 1).astype(np.int64)
+        parts = [
+            (bank[a:b], None if sq_norms is None else sq_norms[a:b])
+            for a, b in zip(bounds[:-1], bounds[1:], strict=True)
+        ]
+        return ShardedKnn(parts, n_neighbors=n_neighbors, n_threads=n_threads)
+
+    def kneighbors(
+        self, X: np.ndarray, n_neighbors: int | None = None
+    ) -> tuple[np.ndarray, np.ndarray]:
+        k = int(n_neighbors or self.n_neighbors)
+        if k > self.n_bank:
+            raise ValueError(f"n_neighbors={k} exceeds bank size {self.n_bank}")
+        X = np.ascontiguousarray(X, dtype=np.float32)
+
+        def search(item: tuple[BruteKnn, int]) -> tuple[np.ndarray, np.ndarray]:
+            knn, offset = item
+            d, j = knn.kneighbors(X, min(k, int(knn.bank.shape[0])))
+            return d, j + offset
+
+        if self.n_threads > 1 and len(self.shards) > 1:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.n_threads)
+                # created lazily so BLAS libraries loaded after import are seen
+                self._blas = ThreadpoolController().select(user_api="blas")
+            budget = max((lib.num_threads for lib in self._blas.lib_controllers), default=1)
+            with self._blas.limit(limits=max(1, budget // self.n_threads)):
+                results = list(self._executor.map(search, self.shards))
+        else:
+            results = [search(s) for s in self.shards]
+
+        return _merge_top_k(
+            np.concatenate([r[0] for r in results], axis=1),
+            np.concatenate([r[1] for r in results], axis=1),
+            k,
+        )
@@ -1,13 +1,26 @@
 ﻿from __future__ import annotations
 
+from collections.abc import Iterable, Iterator
 from dataclasses import dataclass
 from pathlib import Path
 
+import cv2
 import numpy as np
 import timm
 import torch
+import torch.nn.functional as F
 from sklearn.neighbors import NearestNeighbors
 
+from metinspect.image_io import load_image_tensor, load_image_tensor_native
+from metinspect.models.knn import BruteKnn, ShardedKnn, squared_norms
+from metinspect.models.projection import (
+    PROJECTION_METHODS,
+    CovarianceAccumulator,
+    Projection,
+    random_projection,
+)
+from metinspect.tiling import TileStitcher, tile_grid
+
 
 @dataclass
 class PatchCoreArtifacts:
@@ -16,53 +29,241 @@ class PatchCoreArtifacts:
     coreset: np.ndarray
     nn_k: int
     feat_hw: tuple[int, int]
+    # None = whole-image model; otherwise trained on native-resolution tiles of
+    # image_size with this fractional overlap.
+    tile_overlap: float | None = None
+    n_shards: int = 1
+    # Set when the bank is stored as memory-mappable shard files next to the
+    # artifact (path relative to the artifact's folder); coreset is then empty.
+    bank_dir: str | None = None
+    # Rows in the bank; 0 for artifacts saved before this was recorded.
+    bank_rows: int = 0
+    # Optional feature projection fitted at train time; the bank is stored projected.
+    projection: Projection | None = None
+
+    @property
+    def bank_size(self) -> int:
+        return self.bank_rows or int(self.coreset.shape[0])
+
+
+def _shard_paths(bank_dir: Path, j: int) -> tuple[Path, Path]:
+    return bank_dir / f"shard_{j:03d}.npy", bank_dir / f"shard_{j:03d}_sqnorms.npy"
+
+
+def _batched(tensors_1chw: Iterable[torch.Tensor], batch_size: int) -> Iterator[torch.Tensor]:
+    """Concatenate consecutive same-shape 1CHW tensors into BCHW batches."""
+    buf: list[torch.Tensor] = []
+    for t in tensors_1chw:
+        if buf and (len(buf) >= batch_size or t.shape != buf[0].shape):
+            yield torch.cat(buf)
+            buf = []
+        buf.append(t)
+    if buf:
+        yield torch.cat(buf)
+
+
+class _PatchReservoir:
+    """
+    Uniform sample of at most `size` rows from a stream of patch batches
+    (reservoir sampling, vectorized per batch), so training memory is bounded by
+    max_patches rather than by the number of images or tiles.
+    """
+
+    def __init__(self, size: int) -> None:
+        self.size = int(size)
+        self.seen = 0
+        self.filled = 0
+        self.rows: np.ndarray | None = None
+
+    def add(self, X: np.ndarray) -> None:
+        X = np.asarray(X, dtype=np.float32)
+        if self.rows is None:
+            self.rows = np.empty((self.size, X.shape[1]), dtype=np.float32)
+        take = min(self.size - self.filled, X.shape[0])
+        self.rows[self.filled : self.filled + take] = X[:take]
+        self.filled += take
+        self.seen += take
+        X = X[take:]
+        if X.shape[0] == 0:
+            return
+        # row t (0-based over the stream) replaces a random slot with prob size/(t+1)
+        t = self.seen + np.arange(X.shape[0])
+        slot = (np.random.random(X.shape[0]) * (t + 1)).astype(np.int64)
+        keep = slot < self.size
+        self.rows[slot[keep]] = X[keep]
+        self.seen += int(X.shape[0])
+
+    def result(self) -> np.ndarray:
+        if self.rows is None:
+            raise RuntimeError("No training patches.")
+        return self.rows[: self.filled]
 
 
 class PatchCore:
-    def __init__(self, backbone: str, image_size: int, device: str = "cpu", nn_k: int = 1) -> None:
+    def __init__(
+        self,
+        backbone: str,
+        image_size: int,
+        device: str = "cpu",
+        nn_k: int = 1,
+        tile_overlap: float | None = None,
+        n_shards: int = 1,
+        knn_threads: int | None = None,
+    ) -> None:
         self.backbone = backbone
         self.image_size = image_size
         self.device = torch.device(device)
         self.nn_k = nn_k
+        self.tile_overlap = tile_overlap
+        self.n_shards = max(1, int(n_shards))
+        self.knn_threads = knn_threads
 
-        self.model = timm.create_model(
-            backbone,
-            pretrained=True,
-            features_only=True,
-            out_indices=(3,),
-        ).to(self.device)
+        self.model = self._create_backbone().to(self.device)
         self.model.eval()
 
         self.coreset: np.ndarray | None = None
-        self.nn: NearestNeighbors | None = None
+        self.nn: NearestNeighbors | BruteKnn | ShardedKnn | None = None
         self.feat_hw: tuple[int, int] | None = None
+        self.projection: Projection | None = None
+        self._proj_w: torch.Tensor | None = None
+
+    def _create_backbone(self) -> torch.nn.Module:
+        """Feature extractor returning a one-element list of (B,C,Hf,Wf) maps."""
+        return timm.create_model(
+            self.backbone,
+            pretrained=True,
+            features_only=True,
+            out_indices=(3,),
+        )
+
+    def set_projection(self, projection: Projection | None) -> None:
+        self.projection = projection
+        self._proj_w = (
+            None
+            if projection is None
+            else torch.from_numpy(projection.components).to(self.device)
+        )
 
     @torch.no_grad()
     def _embed(self, x: torch.Tensor) -> torch.Tensor:
         feats = self.model(x)[0]  # (B,C,Hf,Wf)
         self.feat_hw = (int(feats.shape[2]), int(feats.shape[3]))
         patches = feats.permute(0, 2, 3, 1).reshape(-1, feats.shape[1])
+        if self._proj_w is not None:
+            patches = patches @ self._proj_w
         return patches
 
+    def _build_index(self, sq_norms: np.ndarray | None = None) -> None:
+        if self.n_shards > 1:
+            self.nn = ShardedKnn.from_bank(
+                self.coreset,
+                self.n_shards,
+                sq_norms=sq_norms,
+                n_neighbors=self.nn_k,
+                n_threads=self.knn_threads,
+            )
+        elif sq_norms is not None:
+            self.nn = BruteKnn(self.coreset, sq_norms, n_neighbors=self.nn_k)
+        else:
+            self.nn = NearestNeighbors(n_neighbors=self.nn_k, algorithm="auto")
+            self.nn.fit(self.coreset)
+
     def fit_embeddings(self, embeddings: np.ndarray) -> None:
         self.coreset = embeddings.astype(np.float32)
-        self.nn = NearestNeighbors(n_neighbors=self.nn_k, algorithm="auto")
-        self.nn.fit(self.coreset)
-
-    def fit_from_tensors(self, tensors_1chw: list[torch.Tensor], max_patches: int = 20000) -> None:
-        embs = []
-        for t in tensors_1chw:
-            t = t.to(self.device)
-            e = self._embed(t).cpu().numpy()
-            embs.append(e)
-        X = np.concatenate(embs, axis=0).astype(np.float32)
-        if X.shape[0] > max_patches:
-            idx = np.random.choice(X.shape[0], size=max_patches, replace=False)
-            X = X[idx]
+        self._build_index()
+
+    @property
+    def tiled(self) -> bool:
+        return self.tile_overlap is not None
+
+    def _pad_to_tile(self, x: torch.Tensor) -> torch.Tensor:
+        tile = self.image_size
+        pad_h = max(0, tile - int(x.shape[2]))
+        pad_w = max(0, tile - int(x.shape[3]))
+        if pad_h or pad_w:
+            x = F.pad(x, (0, pad_w, 0, pad_h), mode="replicate")
+        return x
+
+    def iter_tiles(self, x: torch.Tensor) -> Iterator[torch.Tensor]:
+        """
+        Yield image_size x image_size tiles (1CHW) of a native-resolution image,
+        using the model's tile overlap.
+        """
+        tile = self.image_size
+        h, w = int(x.shape[2]), int(x.shape[3])
+        x = self._pad_to_tile(x)
+        for y0, x0 in tile_grid(h, w, tile, self.tile_overlap or 0.0):
+            yield x[:, :, y0 : y0 + tile, x0 : x0 + tile]
+
+    def attach_bank(self, bank: np.ndarray, sq_norms: np.ndarray | None = None) -> None:
+        """Use an externally owned bank (shared memory / mmap) without copying it."""
+        self.coreset = bank
+        self._build_index(squared_norms(bank) if sq_norms is None else sq_norms)
+
+    def attach_shards(self, bank_dir: Path, n_shards: int) -> None:
+        """Search memory-mapped shard files written by save(mmap_bank=True)."""
+        shards = []
+        for j in range(n_shards):
+            bank_path, norms_path = _shard_paths(bank_dir, j)
+            shards.append((np.load(bank_path, mmap_mode="r"), np.load(norms_path, mmap_mode="r")))
+        # The bank never has to be resident as a whole, so there is no coreset array.
+        self.coreset = None
+        self.n_shards = n_shards
+        self.nn = ShardedKnn(shards, n_neighbors=self.nn_k, n_threads=self.knn_threads)
+
+    def fit_from_tensors(
+        self,
+        tensors_1chw: Iterable[torch.Tensor],
+        max_patches: int = 20000,
+        batch_size: int = 8,
+        projection: str = "none",
+        proj_dim: int = 0,
+        proj_variance: float = 0.99,
+        proj_min_dim: int = 32,
+    ) -> None:
+        """
+        Build the memory bank from a uniform reservoir sample of at most
+        max_patches training patches; inputs are embedded batch_size at a time.
+        With projection="pca" every patch (not just the sample) is streamed into
+        a running covariance and the top components are kept (proj_dim, or enough
+        to explain proj_variance but at least proj_min_dim); "random" uses a
+        sparse random projection. The bank is stored projected and _embed applies
+        the same map.
+        """
+        if projection not in PROJECTION_METHODS:
+            raise ValueError(f"projection must be one of {PROJECTION_METHODS}, got {projection!r}")
+        self.set_projection(None)
+        cov = CovarianceAccumulator() if projection == "pca" else None
+
+        reservoir = _PatchReservoir(max_patches)
+        for batch in _batched(tensors_1chw, batch_size):
+            e = self._embed(batch.to(self.device)).cpu().numpy()
+            if cov is not None:
+                cov.update(e)
+            reservoir.add(e)
+        X = reservoir.result()
+
+        if cov is not None:
+            self.set_projection(
+                cov.pca(dim=proj_dim, variance=proj_variance, min_dim=proj_min_dim)
+            )
+        elif projection == "random":
+            seed = int(np.random.randint(0, 2**31 - 1))
+            self.set_projection(random_projection(X.shape[1], dim=proj_dim, seed=seed))
+        if self.projection is not None:
+            X = self.projection.transform(X)
         self.fit_embeddings(X)
 
+    @property
+    def bank_size(self) -> int:
+        if self.coreset is not None:
+            return int(self.coreset.shape[0])
+        if isinstance(self.nn, ShardedKnn):
+            return self.nn.n_bank
+        return 0
+
     def _check(self) -> None:
-        if self.coreset is None or self.nn is None or self.feat_hw is None:
+        if self.nn is None or self.feat_hw is None:
             raise RuntimeError("Model not fitted. Run train first.")
 
     @torch.no_grad()
@@ -77,24 +278,107 @@ class PatchCore:
         image_score = float(np.max(score_map))
         return image_score, score_map
 
-    def save(self, path: Path) -> None:
+    @torch.no_grad()
+    def score_tiled(self, x: torch.Tensor, batch_size: int = 8) -> tuple[float, np.ndarray]:
+        """
+        Score a native-resolution image (1CHW) tile by tile.
+
+        Tiles are pushed through the backbone and kNN `batch_size` at a time, so
+        peak memory depends on the batch, not the image. Each tile's patch map is
+        upsampled to tile size only and blended into an HxW map that lives on the
+        camera pixel grid (one pixel = pixel_size_mm).
+        """
+        self._check()
+        tile = self.image_size
+        h, w = int(x.shape[2]), int(x.shape[3])
+        xp = self._pad_to_tile(x)
+        grid = tile_grid(h, w, tile, self.tile_overlap or 0.0)
+        stitcher = TileStitcher(h, w, tile)
+        image_score = float("-inf")
+
+        for i in range(0, len(grid), batch_size):
+            origins = grid[i : i + batch_size]
+            batch = torch.cat([xp[:, :, y0 : y0 + tile, x0 : x0 + tile] for y0, x0 in origins])
+            patches = self._embed(batch.to(self.device)).cpu().numpy().astype(np.float32)
+            dists, _ = self.nn.kneighbors(patches)
+            Hf, Wf = self.feat_hw
+            tile_maps = dists[:, 0].reshape(len(origins), Hf, Wf).astype(np.float32)
+            image_score = max(image_score, float(np.max(tile_maps)))
+            for (y0, x0), m in zip(origins, tile_maps, strict=True):
+                up = cv2.resize(m, (tile, tile), interpolation=cv2.INTER_LINEAR)
+                stitcher.add(y0, x0, up)
+
+        return image_score, stitcher.result()
+
+    def score_path(self, path: Path, tile_batch_size: int = 8) -> tuple[float, np.ndarray]:
+        """Load an image the way this model expects (native for tiled) and score it."""
+        if self.tiled:
+            return self.score_tiled(load_image_tensor_native(path), batch_size=tile_batch_size)
+        return self.score(load_image_tensor(path, self.image_size))
+
+    def save(self, path: Path, mmap_bank: bool = False) -> None:
+        """
+        Save the artifact. With mmap_bank the coreset is written as n_shards .npy
+        files (plus squared norms) in <stem>_bank/ so load() can memory-map them.
+        """
         self._check()
+        if self.coreset is None:
+            raise RuntimeError("Bank is memory-mapped; nothing to re-save.")
+        path.parent.mkdir(parents=True, exist_ok=True)
+        coreset = self.coreset
+        bank_dir = None
+        if mmap_bank:
+            bank_dir = f"{path.stem}_bank"
+            (path.parent / bank_dir).mkdir(parents=True, exist_ok=True)
+            bounds = np.linspace(0, coreset.shape[0], self.n_shards + 1).astype(np.int64)
+            for j in range(self.n_shards):
+                part = np.ascontiguousarray(coreset[bounds[j] : bounds[j + 1]])
+                bank_path, norms_path = _shard_paths(path.parent / bank_dir, j)
+                np.save(bank_path, part)
+                np.save(norms_path, squared_norms(part))
+            coreset = np.empty((0, coreset.shape[1]), dtype=np.float32)
+
         art = PatchCoreArtifacts(
             backbone=self.backbone,
             image_size=self.image_size,
-            coreset=self.coreset,
+            coreset=coreset,
             nn_k=self.nn_k,
             feat_hw=self.feat_hw,
+            tile_overlap=self.tile_overlap,
+            n_shards=self.n_shards,
+            bank_dir=bank_dir,
+            bank_rows=self.bank_size,
+            projection=self.projection,
         )
-        path.parent.mkdir(parents=True, exist_ok=True)
         torch.save(art, path)
 
-    @staticmethod
-    def load(path: Path, device: str = "cpu") -> PatchCore:
+    @classmethod
+    def load(
+        cls,
+        path: Path,
+        device: str = "cpu",
+        n_shards: int | None = None,
+        knn_threads: int | None = None,
+    ) -> PatchCore:
+        """
+        n_shards overrides the saved shard count for in-memory banks; memory-mapped
+        banks are always searched with the shard files they were saved as.
+        """
         art: PatchCoreArtifacts = torch.load(path, map_location="cpu", weights_only=False)
-        pc = PatchCore(art.backbone, art.image_size, device=device, nn_k=art.nn_k)
-        pc.coreset = art.coreset
+        pc = cls(
+            art.backbone,
+            art.image_size,
+            device=device,
+            nn_k=art.nn_k,
+            tile_overlap=art.tile_overlap,
+            n_shards=n_shards or art.n_shards,
+            knn_threads=knn_threads,
+        )
         pc.feat_hw = art.feat_hw
-        pc.nn = NearestNeighbors(n_neighbors=art.nn_k, algorithm="auto")
-        pc.nn.fit(pc.coreset)
+        pc.set_projection(art.projection)
+        if art.bank_dir is not None:
+            pc.attach_shards(path.parent / art.bank_dir, art.n_shards)
+        else:
+            pc.coreset = art.coreset
+            pc._build_index()
         return pc
@@ -0,0 +1,94 @@
+from __future__ import annotations
+
+from dataclasses import dataclass
+
+import numpy as np
+
+PROJECTION_METHODS = ("none", "pca", "random")
+
+
+@dataclass
+class Projection:
+    """
+    Linear map x -> x @ components applied to patch embeddings before kNN.
+
+    No centering is applied: kNN distances are translation invariant, so the
+    PCA mean drops out and the projection stays a single matmul.
+    """
+
+    method: str
+    components: np.ndarray  # (C, d) float32
+    explained_variance: float | None = None
+
+    @property
+    def in_dim(self) -> int:
+        return int(self.components.shape[0])
+
+    @property
+    def dim(self) -> int:
+        return int(self.components.shape[1])
+
+    def transform(self, X: np.ndarray) -> np.ndarray:
+        return np.asarray(X, dtype=np.float32) @ self.components
+
+
+class CovarianceAccumulator:
+    """
+    Streams patch batches into a running sum and Gram matrix (float64, CxC), so
+    PCA is fitted in one pass over all training patches; memory is O(C^2) no
+    matter how many patches are seen.
+    """
+
+    def __init__(self) -> None:
+        self.n = 0
+        self._sum: np.ndarray | None = None
+        self._gram: np.ndarray | None = None
+
+    def update(self, X: np.ndarray) -> None:
+        X = np.asarray(X, dtype=np.float64)
+        if self._sum is None:
+            self._sum = np.zeros(X.shape[1])
+            self._gram = np.zeros((X.shape[1], X.shape[1]))
+        self.n += int(X.shape[0])
+        self._sum += X.sum(axis=0)
+        self._gram += X.T @ X
+
+    def pca(self, dim: int = 0, variance: float = 0.99, min_dim: int = 32) -> Projection:
+        """
+        Top principal directions. dim <= 0 picks the smallest dimension whose
+        cumulative explained variance reaches `variance`, but never fewer than
+        min_dim: defects often sit in low-variance directions of normal data.
+        """
+        if self._sum is None or self.n < 2:
+            raise RuntimeError("Need at least two patches to fit PCA.")
+        mean = self._sum / self.n
+        cov = self._gram / self.n - np.outer(mean, mean)
+        evals, evecs = np.linalg.eigh(cov)
+        evals = np.clip(evals[::-1], 0.0, None)
+        evecs = evecs[:, ::-1]
+
+        ratio = np.cumsum(evals) / max(float(np.sum(evals)), 1e-12)
+        if dim <= 0:
+            dim = max(int(np.searchsorted(ratio, variance) + 1), min_dim)
+        dim = int(min(dim, evecs.shape[1]))
+        return Projection(
+            method="pca",
+            components=np.ascontiguousarray(evecs[:, :dim], dtype=np.float32),
+            explained_variance=float(ratio[dim - 1]),
+        )
+
+
+def random_projection(n_features: int, dim: int = 0, seed: int = 0) -> Projection:
+    """
+    Sparse (Achlioptas / Li) random projection with density 1/sqrt(C), stored
+    dense so it runs as the same matmul as PCA. dim <= 0 defaults to C // 4.
+    """
+    if dim <= 0:
+        dim = max(1, n_features // 4)
+    rng = np.random.default_rng(seed)
+    density = 1.0 / np.sqrt(n_features)
+    nonzero = rng.random((n_features, dim)) < density
+    signs = rng.choice(np.array([-1.0, 1.0]), size=(n_features, dim))
+    scale = np.sqrt(1.0 / (density * dim))
+    components = (nonzero * signs * scale).astype(np.float32)
+    return Projection(method="random", components=components)
@@ -0,0 +1,213 @@
+from __future__ import annotations
+
+import math
+import multiprocessing as mp
+import os
+from collections.abc import Iterator, Sequence
+from dataclasses import dataclass, replace
+from multiprocessing import shared_memory
+from pathlib import Path
+
+import numpy as np
+import torch
+
+from metinspect.models.knn import squared_norms
+from metinspect.models.patchcore import PatchCore, PatchCoreArtifacts
+
+_THREAD_ENV_VARS = (
+    "OMP_NUM_THREADS",
+    "MKL_NUM_THREADS",
+    "OPENBLAS_NUM_THREADS",
+    "NUMEXPR_NUM_THREADS",
+    "VECLIB_MAXIMUM_THREADS",
+)
+
+
+@dataclass(frozen=True)
+class SharedBankSpec:
+    """Everything a worker needs to attach to a SharedBank (small, picklable)."""
+
+    name: str
+    n: int
+    d: int
+
+
+class SharedBank:
+    """
+    Memory bank and its squared norms in one `multiprocessing.shared_memory`
+    segment. The owner creates and unlinks it; workers attach by name and get
+    zero-copy read-only views.
+    """
+
+    def __init__(self, shm: shared_memory.SharedMemory, n: int, d: int, owner: bool) -> None:
+        self._shm = shm
+        self.spec = SharedBankSpec(shm.name, n, d)
+        self.owner = owner
+        self.bank = np.ndarray((n, d), dtype=np.float32, buffer=shm.buf)
+        self.sq_norms = np.ndarray((n,), dtype=np.float32, buffer=shm.buf, offset=n * d * 4)
+        if not owner:
+            self.bank.flags.writeable = False
+            self.sq_norms.flags.writeable = False
+
+    @staticmethod
+    def create(bank: np.ndarray) -> SharedBank:
+        bank = np.ascontiguousarray(bank, dtype=np.float32)
+        n, d = bank.shape
+        shm = shared_memory.SharedMemory(create=True, size=max(1, n * d * 4 + n * 4))
+        sb = SharedBank(shm, n, d, owner=True)
+        sb.bank[:] = bank
+        sb.sq_norms[:] = squared_norms(bank)
+        return sb
+
+    @staticmethod
+    def attach(spec: SharedBankSpec) -> SharedBank:
+        try:
+            # Python >= 3.13: keep workers from registering the segment for cleanup.
+            shm = shared_memory.SharedMemory(name=spec.name, track=False)
+        except TypeError:
+            shm = shared_memory.SharedMemory(name=spec.name)
+        return SharedBank(shm, spec.n, spec.d, owner=False)
+
+    def close(self) -> None:
+        # Drop views before closing, otherwise the buffer is still exported.
+        del self.bank, self.sq_norms
+        self._shm.close()
+        if self.owner:
+            self._shm.unlink()
+
+
+# Per-process worker state, populated by _init_worker.
+_worker_pc: PatchCore | None = None
+_worker_bank: SharedBank | None = None
+_worker_limits: object | None = None
+
+
+def _init_worker(
+    model_path: Path,
+    meta: PatchCoreArtifacts,
+    spec: SharedBankSpec | None,
+    device: str,
+    threads: int,
+    n_shards: int,
+    model_cls: type[PatchCore] = PatchCore,
+) -> None:
+    from threadpoolctl import threadpool_limits
+
+    global _worker_pc, _worker_bank, _worker_limits
+    torch.set_num_threads(threads)
+    _worker_limits = threadpool_limits(limits=threads)
+
+    knn_threads = min(n_shards, threads)
+    if spec is None:
+        # Memory-mapped shard files: the OS page cache is already shared.
+        _worker_pc = model_cls.load(model_path, device=device, knn_threads=knn_threads)
+        return
+
+    bank = SharedBank.attach(spec)
+    pc = model_cls(
+        meta.backbone,
+        meta.image_size,
+        device=device,
+        nn_k=meta.nn_k,
+        tile_overlap=meta.tile_overlap,
+        n_shards=n_shards,
+        knn_threads=knn_threads,
+    )
+    pc.feat_hw = meta.feat_hw
+    pc.set_projection(meta.projection)
+    pc.attach_bank(bank.bank, bank.sq_norms)
+    _worker_bank = bank
+    _worker_pc = pc
+
+
+def _score_path(args: tuple[str, int]) -> tuple[float, np.ndarray]:
+    path, tile_batch_size = args
+    pc = _worker_pc
+    if pc is None:
+        raise RuntimeError("Scoring worker not initialised.")
+    return pc.score_path(Path(path), tile_batch_size=tile_batch_size)
+
+
+class ScoringPool:
+    """
+    Process pool of PatchCore scorers sharing one memory bank.
+
+    The parent loads the artifact once and copies the coreset into a SharedBank;
+    each worker builds its own backbone but attaches to the bank by name, so bank
+    memory does not grow with the number of workers. Artifacts saved with a
+    memory-mapped bank skip the SharedBank and let workers map the shard files.
+    Torch and BLAS thread pools are pinned per worker (default: cores // workers)
+    to avoid oversubscription. model_cls must be importable by the spawned
+    workers (a PatchCore subclass at module level).
+
+        with ScoringPool(model_path, n_workers=4) as pool:
+            for score, score_map in pool.score_paths(paths):
+                ...
+    """
+
+    def __init__(
+        self,
+        model_path: Path,
+        n_workers: int,
+        device: str = "cpu",
+        threads_per_worker: int | None = None,
+        tile_batch_size: int = 8,
+        n_shards: int | None = None,
+        model_cls: type[PatchCore] = PatchCore,
+    ) -> None:
+        art: PatchCoreArtifacts = torch.load(model_path, map_location="cpu", weights_only=False)
+        self.n_workers = max(1, int(n_workers))
+        self.threads = threads_per_worker or max(1, (os.cpu_count() or 1) // self.n_workers)
+        self.tile_batch_size = tile_batch_size
+
+        # Memory-mapped banks are always searched as the shard files they were saved as.
+        n_shards = art.n_shards if art.bank_dir is not None else n_shards or art.n_shards
+        self.n_shards = n_shards
+        self.bank_size = art.bank_size
+        self.bank = None if art.bank_dir is not None else SharedBank.create(art.coreset)
+        # Artifact metadata without the coreset; this is what gets pickled to workers.
+        self.meta = replace(art, coreset=np.empty((0, art.coreset.shape[1]), dtype=np.float32))
+        del art
+        spec = None if self.bank is None else self.bank.spec
+
+        # Workers are spawned, so BLAS reads these at import; restore ours afterwards.
+        saved = {k: os.environ.get(k) for k in _THREAD_ENV_VARS}
+        os.environ.update({k: str(self.threads) for k in _THREAD_ENV_VARS})
+        try:
+            ctx = mp.get_context("spawn")
+            self._pool = ctx.Pool(
+                self.n_workers,
+                initializer=_init_worker,
+                initargs=(model_path, self.meta, spec, device, self.threads, n_shards, model_cls),
+            )
+        except BaseException:
+            if self.bank is not None:
+                self.bank.close()
+            raise
+        finally:
+            for k, v in saved.items():
+                if v is None:
+                    os.environ.pop(k, None)
+                else:
+                    os.environ[k] = v
+
+    def score_paths(self, paths: Sequence[Path]) -> Iterator[tuple[float, np.ndarray]]:
+        """Score images in input order; contiguous chunks are sharded across workers."""
+        chunksize = max(1, math.ceil(len(paths) / (self.n_workers * 4)))
+        jobs = [(str(p), self.tile_batch_size) for p in paths]
+        yield from self._pool.imap(_score_path, jobs, chunksize=chunksize)
+
+    def close(self, terminate: bool = False) -> None:
+        if terminate:
+            self._pool.terminate()
+        else:
+            self._pool.close()
+        self._pool.join()
+        if self.bank is not None:
+            self.bank.close()
+
+    def __enter__(self) -> ScoringPool:
+        return self
+
+    def __exit__(self, exc_type: type[BaseException] | None, *exc: object) -> None:
+        self.close(terminate=exc_type is not None)
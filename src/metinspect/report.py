@@ -0,0 +1,167 @@
+from __future__ import annotations
+
+import csv
+import json
+from dataclasses import dataclass
+from pathlib import Path
+
+import numpy as np
+
+from metinspect.runlog import RUN_LOG_NAME, Columns, best_per, fingerprints, group_stats, load_runs
+from metinspect.viz import save_metric_bars
+
+REPORT_METRICS = ["image_auroc", "pixel_auroc", "escape_rate", "false_reject_rate", "review_rate"]
+# Configuration fields logged by eval; seed, run_id, timestamp and metrics_file vary
+# within a configuration and are averaged over.
+DEFAULT_GROUP_BY = [
+    "category",
+    "backbone",
+    "bank_size",
+    "tiled",
+    "n_shards",
+    "projection",
+    "proj_dim",
+]
+
+
+@dataclass
+class ReportResult:
+    table_csv: Path
+    summary_md: Path
+    n_runs: int
+    n_groups: int
+    replotted: list[str]
+
+
+def _cell(v: object) -> str:
+    if isinstance(v, (float, np.floating)):
+        if np.isnan(v):
+            return ""
+        return str(int(v)) if float(v).is_integer() else f"{float(v):.6g}"
+    return str(v)
+
+
+def _fmt(v: float) -> str:
+    return "NA" if np.isnan(v) else f"{v:.4f}"
+
+
+def _config_labels(stats: Columns, keys: list[str]) -> list[str]:
+    rest = [k for k in keys if k != "category"]
+    n = len(stats["category"])
+    if not rest:
+        return ["all"] * n
+    return ["/".join(_cell(stats[k][i]) for k in rest) for i in range(n)]
+
+
+def _write_table(path: Path, stats: Columns) -> None:
+    names = list(stats)
+    with path.open("w", newline="", encoding="utf-8") as f:
+        w = csv.writer(f)
+        w.writerow(names)
+        for i in range(len(stats["n_runs"])):
+            w.writerow([_cell(stats[k][i]) for k in names])
+
+
+def _write_summary(
+    path: Path, table_csv: Path, n_runs: int, keys: list[str], best: Columns
+) -> None:
+    labels = _config_labels(best, keys)
+    rest = "/".join(k for k in keys if k != "category") or "-"
+    img = best["image_auroc_mean"]
+    pix = best["pixel_auroc_mean"]
+
+    lines = ["# Evaluation report\n"]
+    lines.append(f"- Runs logged: {n_runs}")
+    lines.append(f"- Grouped by: `{', '.join(keys)}` (mean/std across remaining fields, e.g. seed)")
+    lines.append(f"- Table: `{table_csv.as_posix()}`\n")
+    if np.any(~np.isnan(img)):
+        lines.append(f"- best image AUROC: mean over categories={np.nanmean(img):.4f}")
+    if np.any(~np.isnan(pix)):
+        lines.append(f"- best pixel AUROC: mean over categories={np.nanmean(pix):.4f}")
+
+    lines.append("\n## Best configuration per category (by mean image AUROC)\n")
+    lines.append(f"| category | {rest} | runs | image_auroc | pixel_auroc |")
+    lines.append("|---|---|---:|---:|---:|")
+    for i, cat in enumerate(best["category"]):
+        img_s = f"{_fmt(img[i])} ± {_fmt(best['image_auroc_std'][i])}"
+        pix_s = f"{_fmt(pix[i])} ± {_fmt(best['pixel_auroc_std'][i])}"
+        lines.append(
+            f"| {cat} | {labels[i]} | {int(best['n_runs'][i])} | {img_s} | {pix_s} |"
+        )
+    path.write_text("\n".join(lines) + "\n", encoding="utf-8")
+
+
+def build_report(
+    reports_dir: Path, group_by: list[str] | None = None, force: bool = False
+) -> ReportResult:
+    """
+    Aggregate the eval run log into a grouped table, a markdown summary and
+    figures. Per-category figures are only redrawn for categories with new runs
+    since the last report (tracked in figures/report/state.json) unless force.
+    Without group_by, the DEFAULT_GROUP_BY fields present in the log are used.
+    """
+    cols = load_runs(reports_dir / RUN_LOG_NAME)
+    keys = list(group_by or [k for k in DEFAULT_GROUP_BY if k in cols])
+    if "category" not in keys:
+        raise ValueError("group_by must include 'category'.")
+    missing = [k for k in keys if k not in cols]
+    if missing:
+        raise ValueError(f"Unknown group_by fields: {missing}. Available: {sorted(cols)}")
+
+    stats = group_stats(cols, keys, REPORT_METRICS)
+    for m in ("image_auroc", "pixel_auroc"):
+        # runs that predate a metric still need the column for the summary
+        stats.setdefault(f"{m}_mean", np.full(len(stats["n_runs"]), np.nan))
+        stats.setdefault(f"{m}_std", np.full(len(stats["n_runs"]), np.nan))
+    best = best_per(stats, "category", "image_auroc_mean")
+
+    table_csv = reports_dir / "report_table.csv"
+    summary_md = reports_dir / "report_summary.md"
+    _write_table(table_csv, stats)
+    _write_summary(summary_md, table_csv, len(cols["run_id"]), keys, best)
+
+    fig_dir = reports_dir / "figures" / "report"
+    state_path = fig_dir / "state.json"
+    old = json.loads(state_path.read_text(encoding="utf-8")) if state_path.exists() else {}
+    # group_by changes the per-category bars, so it is part of the state
+    new = {f"{','.join(keys)}|{c}": fp for c, fp in fingerprints(cols).items()}
+    labels = _config_labels(stats, keys)
+
+    replotted = []
+    for key, fp in new.items():
+        cat = key.split("|", 1)[1]
+        out_path = fig_dir / "categories" / f"{cat}.png"
+        if not force and old.get(key) == fp and out_path.exists():
+            continue
+        rows = np.flatnonzero(stats["category"] == cat)
+        save_metric_bars(
+            out_path,
+            [labels[i] for i in rows],
+            {
+                "image": (stats["image_auroc_mean"][rows], stats["image_auroc_std"][rows]),
+                "pixel": (stats["pixel_auroc_mean"][rows], stats["pixel_auroc_std"][rows]),
+            },
+            title=f"{cat}: AUROC by configuration",
+        )
+        replotted.append(cat)
+
+    if replotted or old.keys() != new.keys():
+        save_metric_bars(
+            fig_dir / "best_auroc_by_category.png",
+            [str(c) for c in best["category"]],
+            {
+                "image": (best["image_auroc_mean"], best["image_auroc_std"]),
+                "pixel": (best["pixel_auroc_mean"], best["pixel_auroc_std"]),
+            },
+            title="Best configuration per category",
+        )
+    fig_dir.mkdir(parents=True, exist_ok=True)
+    state_path.write_text(json.dumps(new, indent=2), encoding="utf-8")
+
+    return ReportResult(
+        table_csv=table_csv,
+        summary_md=summary_md,
+        n_runs=len(cols["run_id"]),
+        n_groups=len(stats["n_runs"]),
+        replotted=replotted,
+    )
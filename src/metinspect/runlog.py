@@ -0,0 +1,134 @@
+from __future__ import annotations
+
+import json
+import uuid
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import Any
+
+import numpy as np
+
+RUN_LOG_NAME = "runs.jsonl"
+
+Columns = dict[str, np.ndarray]
+
+
+def append_run(path: Path, row: dict[str, Any]) -> dict[str, Any]:
+    """
+    Append one eval run to the log (JSON Lines, never rewritten). Adds run_id and
+    a UTC timestamp; new metric keys simply become new columns on load. [lo, hi]
+    pairs (bootstrap CIs) are flattened to <key>_low / <key>_high.
+    """
+    flat: dict[str, Any] = {}
+    for k, v in row.items():
+        if isinstance(v, (list, tuple)) and len(v) == 2:
+            flat[f"{k}_low"], flat[f"{k}_high"] = v
+        else:
+            flat[k] = v
+    row = {
+        "run_id": uuid.uuid4().hex[:12],
+        "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+        **flat,
+    }
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with path.open("a", encoding="utf-8") as f:
+        f.write(json.dumps(row) + "\n")
+    return row
+
+
+def load_runs(path: Path) -> Columns:
+    """
+    Load the run log into columns. Numeric/bool fields become float64 (NaN when
+    missing), everything else str ("" when missing).
+    """
+    if not path.exists():
+        raise FileNotFoundError(f"Run log not found: {path}. Run `metinspect eval` first.")
+    rows = [json.loads(line) for line in path.read_text(encoding="utf-8").splitlines() if line]
+    keys: dict[str, None] = {}
+    for r in rows:
+        keys.update(dict.fromkeys(r))
+
+    cols: Columns = {}
+    for k in keys:
+        vals = [r.get(k) for r in rows]
+        present = [v for v in vals if v is not None]
+        if present and all(isinstance(v, (int, float)) for v in present):
+            cols[k] = np.array([np.nan if v is None else v for v in vals], dtype=np.float64)
+        else:
+            cols[k] = np.array(["" if v is None else str(v) for v in vals], dtype=str)
+    return cols
+
+
+# Stand-in for a missing (NaN) numeric key while grouping: NaN never compares equal,
+# so np.unique would otherwise put every run that lacks the field in its own group.
+_MISSING_KEY = np.inf
+
+
+def _group_index(cols: Columns, keys: list[str]) -> tuple[Columns, np.ndarray]:
+    """
+    Unique key combinations (one column per key) and each row's group id. Runs
+    missing a numeric key share a group per remaining key combination; the key
+    comes back as NaN.
+    """
+    numeric = [k for k in keys if cols[k].dtype.kind == "f"]
+    arrays = [
+        np.where(np.isnan(cols[k]), _MISSING_KEY, cols[k]) if k in numeric else cols[k]
+        for k in keys
+    ]
+    uniq, inv = np.unique(np.rec.fromarrays(arrays, names=keys), return_inverse=True)
+    out: Columns = {k: np.asarray(uniq[k]) for k in keys}
+    for k in numeric:
+        out[k] = np.where(out[k] == _MISSING_KEY, np.nan, out[k])
+    return out, inv.reshape(-1)
+
+
+def group_stats(cols: Columns, keys: list[str], metrics: list[str]) -> Columns:
+    """
+    Mean / sample std / count of each metric per unique combination of `keys`
+    (e.g. across seeds), computed with bincount over the group ids. NaNs are
+    ignored; std is NaN for groups with fewer than two values.
+    """
+    uniq, inv = _group_index(cols, keys)
+    g = len(uniq[keys[0]])
+    out: Columns = dict(uniq)
+    out["n_runs"] = np.bincount(inv, minlength=g).astype(np.float64)
+
+    for m in metrics:
+        if m not in cols:
+            continue
+        v = cols[m]
+        ok = ~np.isnan(v)
+        v0 = np.where(ok, v, 0.0)
+        n = np.bincount(inv, weights=ok, minlength=g)
+        s = np.bincount(inv, weights=v0, minlength=g)
+        ss = np.bincount(inv, weights=v0 * v0, minlength=g)
+        with np.errstate(divide="ignore", invalid="ignore"):
+            mean = s / n
+            var = (ss - n * mean * mean) / (n - 1)
+        out[f"{m}_mean"] = mean
+        out[f"{m}_std"] = np.where(n > 1, np.sqrt(np.maximum(var, 0.0)), np.nan)
+    return out
+
+
+def best_per(stats: Columns, by: str, metric: str) -> Columns:
+    """Row of `stats` with the highest `metric` for each value of `by` (NaN last)."""
+    score = np.nan_to_num(stats[metric], nan=-np.inf)
+    order = np.lexsort((-score, stats[by]))
+    _, first = np.unique(stats[by][order], return_index=True)
+    pick = order[first]
+    return {k: v[pick] for k, v in stats.items()}
+
+
+def fingerprints(cols: Columns, by: str = "category") -> dict[str, str]:
+    """
+    Change marker per group: row count plus the last run_id. The log is
+    append-only, so any new run for a group changes its fingerprint.
+    """
+    uniq, inv = np.unique(cols[by], return_inverse=True)
+    counts = np.bincount(inv, minlength=len(uniq))
+    last = np.zeros(len(uniq), dtype=np.int64)
+    np.maximum.at(last, inv, np.arange(len(inv)))
+    return {
+        str(u): f"{int(c)}:{cols['run_id'][i]}"
+        for u, c, i in zip(uniq, counts, last, strict=True)
+    }
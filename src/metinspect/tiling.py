@@ -0,0 +1,57 @@
+from __future__ import annotations
+
+import numpy as np
+
+
+def tile_origins(length: int, tile: int, stride: int) -> list[int]:
+    """
+    Start offsets of tiles covering [0, length). The last tile is pushed flush
+    against the end so no tile ever reaches past the image border.
+    """
+    if length <= tile:
+        return [0]
+    origins = list(range(0, length - tile + 1, stride))
+    if origins[-1] != length - tile:
+        origins.append(length - tile)
+    return origins
+
+
+def tile_grid(h: int, w: int, tile: int, overlap: float) -> list[tuple[int, int]]:
+    if not 0.0 <= overlap < 1.0:
+        raise ValueError(f"overlap must be in [0, 1), got {overlap}")
+    stride = max(1, int(round(tile * (1.0 - overlap))))
+    return [(y, x) for y in tile_origins(h, tile, stride) for x in tile_origins(w, tile, stride)]
+
+
+def blend_window(tile: int) -> np.ndarray:
+    """
+    Separable triangular window used to weight overlapping tiles. It is kept
+    strictly positive so pixels covered by a single tile (image corners) still
+    get a valid score.
+    """
+    ramp = np.minimum(np.arange(tile) + 0.5, tile - np.arange(tile) - 0.5) / (tile / 2.0)
+    ramp = np.clip(ramp, 1e-3, 1.0).astype(np.float32)
+    return np.outer(ramp, ramp)
+
+
+class TileStitcher:
+    """Accumulates weighted tile maps into a full-resolution score map."""
+
+    def __init__(self, h: int, w: int, tile: int) -> None:
+        self.h = h
+        self.w = w
+        self.tile = tile
+        self.window = blend_window(tile)
+        self._acc = np.zeros((h, w), dtype=np.float32)
+        self._wsum = np.zeros((h, w), dtype=np.float32)
+
+    def add(self, y: int, x: int, tile_map: np.ndarray) -> None:
+        # Tiles may overhang when the image is smaller than the tile (padded input).
+        th = min(self.tile, self.h - y)
+        tw = min(self.tile, self.w - x)
+        win = self.window[:th, :tw]
+        self._acc[y : y + th, x : x + tw] += tile_map[:th, :tw] * win
+        self._wsum[y : y + th, x : x + tw] += win
+
+    def result(self) -> np.ndarray:
+        return self._acc / np.maximum(self._wsum, 1e-12)
@@ -47,3 +47,32 @@ def save_overlay_figure(
     fig.tight_layout()
     fig.savefig(out_path, dpi=150)
     plt.close(fig)
+
+
+def save_metric_bars(
+    out_path: Path,
+    labels: list[str],
+    series: dict[str, tuple[np.ndarray, np.ndarray | None]],
+    title: str,
+    ylabel: str = "AUROC",
+) -> None:
+    """Grouped bar chart; series maps a legend name to (values, std or None)."""
+    out_path.parent.mkdir(parents=True, exist_ok=True)
+    x = np.arange(len(labels))
+    width = 0.8 / max(1, len(series))
+
+    fig = plt.figure(figsize=(max(6, 0.6 * len(labels) + 2), 5))
+    ax = fig.add_subplot(1, 1, 1)
+    for j, (name, (vals, err)) in enumerate(series.items()):
+        yerr = None if err is None else np.nan_to_num(err, nan=0.0)
+        ax.bar(x + (j - (len(series) - 1) / 2) * width, vals, width, yerr=yerr, label=name)
+
+    ax.set_xticks(x)
+    ax.set_xticklabels(labels, rotation=45, ha="right")
+    ax.set_ylim(0.0, 1.0)
+    ax.set_ylabel(ylabel)
+    ax.set_title(title)
+    ax.legend()
+    fig.tight_layout()
+    fig.savefig(out_path, dpi=150)
+    plt.close(fig)
@@ -0,0 +1,23 @@
+import torch
+
+from metinspect.models.patchcore import PatchCore
+
+
+class _StubBackbone(torch.nn.Module):
+    def __init__(self) -> None:
+        super().__init__()
+        torch.manual_seed(0)
+        self.conv = torch.nn.Conv2d(3, 8, kernel_size=4, stride=4)
+
+    def forward(self, x: torch.Tensor) -> list[torch.Tensor]:
+        return [self.conv(x)]
+
+
+class StubPatchCore(PatchCore):
+    """
+    Tiny fixed-weight backbone (stride 4) so tests, including spawned workers,
+    need no pretrained download.
+    """
+
+    def _create_backbone(self) -> torch.nn.Module:
+        return _StubBackbone()
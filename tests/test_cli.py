@@ -1,6 +1,17 @@
+import json
+from pathlib import Path
+
+import cv2
+import numpy as np
+import pytest
+import yaml
+from stub_backbone import StubPatchCore
 from typer.testing import CliRunner
 
+from metinspect import cli
 from metinspect.cli import app
+from metinspect.data.mvtec import index_test_split
+from metinspect.metrics import pixel_auroc
 
 runner = CliRunner()
 
@@ -10,3 +21,70 @@ def test_cli_help():
     assert r.exit_code == 0
     assert "metinspect" in r.stdout
 
+
+
+def _write_mvtec(root: Path, hw: tuple[int, int]) -> None:
+    rng = np.random.default_rng(0)
+    cat = root / "bottle"
+    for d in ["train/good", "test/good", "test/crack", "ground_truth/crack"]:
+        (cat / d).mkdir(parents=True)
+
+    def image() -> np.ndarray:
+        return (120 + rng.normal(0, 5, (*hw, 3))).clip(0, 255).astype(np.uint8)
+
+    for i in range(4):
+        cv2.imwrite(str(cat / f"train/good/{i:03d}.png"), image())
+        cv2.imwrite(str(cat / f"test/good/{i:03d}.png"), image())
+    for i in range(4):
+        img, mask = image(), np.zeros(hw, dtype=np.uint8)
+        y, x = rng.integers(0, min(hw) - 6, 2)
+        img[y : y + 6, x : x + 6] = 255
+        mask[y : y + 6, x : x + 6] = 255
+        cv2.imwrite(str(cat / f"test/crack/{i:03d}.png"), img)
+        cv2.imwrite(str(cat / f"ground_truth/crack/{i:03d}_mask.png"), mask)
+
+
+@pytest.mark.parametrize("tiled", [False, True])
+def test_train_eval_dump_maps(tmp_path, monkeypatch, tiled):
+    monkeypatch.setattr(cli, "PatchCore", StubPatchCore)
+    native_hw = (40, 56)
+    _write_mvtec(tmp_path / "mvtec", native_hw)
+    cfg = {
+        "paths": {"mvtec_dir": str(tmp_path / "mvtec"), "reports_dir": str(tmp_path / "reports")},
+        "runtime": {"device": "cpu", "seed": 0},
+        "mvtec": {"category": "bottle", "image_size": 32},
+        "tiling": {"enabled": tiled, "overlap": 0.25, "batch_size": 4},
+        # tiled run also covers memory-mapped shards and PCA
+        "knn": {"n_shards": 3 if tiled else 1, "mmap_bank": tiled},
+        "projection": {"method": "pca" if tiled else "none", "dim": 4},
+        "decision": {"ok_thresh": 0.35, "nok_thresh": 0.65},
+    }
+    cfg_path = tmp_path / "cfg.yaml"
+    cfg_path.write_text(yaml.safe_dump(cfg), encoding="utf-8")
+
+    r = runner.invoke(app, ["train", "-c", str(cfg_path), "--max-patches", "500"])
+    assert r.exit_code == 0, r.output
+    dump = tmp_path / "maps.npy"
+    args = ["-c", str(cfg_path), "--n-boot", "0", "--gallery-n", "2", "--dump-maps", str(dump)]
+    r = runner.invoke(app, ["eval", *args])
+    assert r.exit_code == 0, r.output
+
+    maps = np.load(dump, mmap_mode="r")
+    # stub backbone has stride 4: 8x8 whole-image grid, native size / 4 when tiled
+    assert maps.shape == ((8, 10, 14) if tiled else (8, 8, 8))
+    assert maps.dtype == np.float16
+    index = json.loads(dump.with_suffix(".json").read_text(encoding="utf-8"))
+    assert [e["label"] for e in index] == [1] * 4 + [0] * 4
+
+    samples = index_test_split(tmp_path / "mvtec", "bottle")
+    if tiled:
+        masks = [cli._read_mask_on_grid(s, maps.shape[1:]) for s in samples]
+        score_maps = [m.astype(np.float32) for m in maps]
+    else:
+        masks = [cli._read_mask(s, 32) for s in samples]
+        score_maps = [cli._upsample_map(m, 32) for m in maps]
+    metrics_path = tmp_path / "reports" / "metrics_patchcore_bottle_resnet18.json"
+    metrics = json.loads(metrics_path.read_text(encoding="utf-8"))
+    assert metrics["tiled"] is tiled
+    assert (metrics["n_shards"], metrics["projection"]) == ((3, "pca") if tiled else (1, "none"))
+    assert abs(metrics["pixel_auroc"] - pixel_auroc(masks, score_maps)) < 1e-3
@@ -0,0 +1,56 @@
+import numpy as np
+from sklearn.neighbors import NearestNeighbors
+
+from metinspect.models import knn as knn_mod
+from metinspect.models.knn import BruteKnn, ShardedKnn
+from metinspect.models.shared_bank import SharedBank
+
+
+def test_brute_knn_matches_sklearn(monkeypatch):
+    rng = np.random.default_rng(0)
+    bank = rng.normal(size=(500, 32)).astype(np.float32)
+    q = rng.normal(size=(40, 32)).astype(np.float32)
+    ref_d, ref_i = NearestNeighbors(n_neighbors=3).fit(bank).kneighbors(q)
+    d, i = BruteKnn(bank, n_neighbors=3).kneighbors(q)
+    assert np.array_equal(i, ref_i)
+    assert np.allclose(d, ref_d, atol=1e-4)
+
+    # tiny blocks: queries and bank rows are both chunked, top-k merged across chunks
+    monkeypatch.setattr(knn_mod, "_MAX_BLOCK", 64)
+    monkeypatch.setattr(knn_mod, "_MIN_QUERY_BLOCK", 8)
+    d, i = BruteKnn(bank, n_neighbors=3).kneighbors(q)
+    assert np.array_equal(i, ref_i)
+    assert np.allclose(d, ref_d, atol=1e-4)
+
+
+def test_sharded_knn_merges_exact_top_k(tmp_path):
+    rng = np.random.default_rng(1)
+    bank = rng.normal(size=(301, 16)).astype(np.float32)
+    q = rng.normal(size=(25, 16)).astype(np.float32)
+    ref_d, ref_i = BruteKnn(bank, n_neighbors=4).kneighbors(q)
+
+    d, i = ShardedKnn.from_bank(bank, 5, n_neighbors=4, n_threads=3).kneighbors(q)
+    assert np.array_equal(i, ref_i)
+    assert np.allclose(d, ref_d)
+
+    parts = np.array_split(bank, 3)
+    for j, part in enumerate(parts):
+        np.save(tmp_path / f"s{j}.npy", part)
+    mm = [(np.load(tmp_path / f"s{j}.npy", mmap_mode="r"), None) for j in range(3)]
+    d, i = ShardedKnn(mm, n_neighbors=4).kneighbors(q)
+    assert np.array_equal(i, ref_i)
+
+
+def test_shared_bank_attach_is_zero_copy():
+    bank = np.arange(12, dtype=np.float32).reshape(4, 3)
+    owner = SharedBank.create(bank)
+    try:
+        worker = SharedBank.attach(owner.spec)
+        assert np.array_equal(worker.bank, bank)
+        assert np.allclose(worker.sq_norms, (bank**2).sum(1))
+        assert not worker.bank.flags.writeable
+        owner.bank[0, 0] = -1.0
+        assert worker.bank[0, 0] == -1.0
+        worker.close()
+    finally:
+        owner.close()
@@ -0,0 +1,35 @@
+import numpy as np
+from sklearn.metrics import average_precision_score, roc_auc_score
+
+from metinspect.metrics import BinnedAuroc, image_score_report, pixel_auroc, roc_analysis
+
+
+def test_roc_analysis_matches_sklearn_with_ties():
+    rng = np.random.default_rng(0)
+    y = rng.integers(0, 2, 200)
+    s = np.round(rng.normal(size=200) + y, 1)
+    ra = roc_analysis(y, s)
+    assert np.isclose(ra.auroc, roc_auc_score(y, s))
+    assert np.isclose(ra.average_precision, average_precision_score(y, s))
+
+
+def test_decision_rates():
+    y = np.array([0, 0, 0, 1, 1, 1])
+    s = np.array([0.1, 0.5, 0.9, 0.2, 0.6, 0.8])
+    r = image_score_report(y, s, ok_thresh=0.35, nok_thresh=0.65, n_boot=50)
+    assert np.isclose(r["escape_rate"], 1 / 3)
+    assert np.isclose(r["false_reject_rate"], 1 / 3)
+    assert np.isclose(r["review_rate"], 2 / 6)
+    assert (r["score_min"], r["score_max"]) == (0.1, 0.9)
+    lo, hi = r["image_auroc_ci"]
+    assert lo <= hi
+
+
+def test_binned_auroc_close_to_exact():
+    rng = np.random.default_rng(1)
+    masks = [(rng.random((32, 32)) > 0.9).astype(np.uint8) for _ in range(5)]
+    maps = [rng.normal(size=(32, 32)).astype(np.float32) + m for m in masks]
+    acc = BinnedAuroc(min(float(m.min()) for m in maps), max(float(m.max()) for m in maps))
+    for m, s in zip(masks, maps, strict=True):
+        acc.update(m, s)
+    assert abs(acc.compute() - pixel_auroc(masks, maps)) < 1e-3
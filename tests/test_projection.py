@@ -0,0 +1,31 @@
+import numpy as np
+
+from metinspect.models.projection import CovarianceAccumulator, random_projection
+
+
+def test_streamed_pca_matches_batch_and_auto_dim():
+    rng = np.random.default_rng(0)
+    # 4 strong directions + small isotropic noise in 64 dims
+    X = rng.normal(size=(2000, 4)) @ rng.normal(size=(4, 64)) * 5 + rng.normal(size=(2000, 64))
+    X = X.astype(np.float32)
+    acc = CovarianceAccumulator()
+    for chunk in np.array_split(X, 7):
+        acc.update(chunk)
+
+    proj = acc.pca(dim=0, variance=0.9, min_dim=1)
+    assert proj.dim == 4
+    assert proj.explained_variance >= 0.9
+    assert acc.pca(dim=0, variance=0.9, min_dim=16).dim == 16
+
+    # full-rank PCA is a rotation: pairwise distances are unchanged
+    full = acc.pca(dim=64)
+    a, b = X[:10], X[10:20]
+    d0 = np.linalg.norm(a - b, axis=1)
+    d1 = np.linalg.norm(full.transform(a) - full.transform(b), axis=1)
+    assert np.allclose(d0, d1, rtol=1e-3)
+
+
+def test_random_projection_shape():
+    proj = random_projection(256, dim=0, seed=1)
+    assert proj.components.shape == (256, 64)
+    assert proj.components.dtype == np.float32
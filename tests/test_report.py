@@ -0,0 +1,41 @@
+import csv
+from pathlib import Path
+
+from metinspect.report import build_report
+from metinspect.runlog import RUN_LOG_NAME, append_run
+
+
+def _rows(path: Path) -> list[dict[str, str]]:
+    with path.open(encoding="utf-8") as f:
+        return list(csv.DictReader(f))
+
+
+def test_default_grouping_keeps_configs_apart(tmp_path: Path):
+    log = tmp_path / RUN_LOG_NAME
+    base = {"category": "bottle", "backbone": "resnet18", "bank_size": 1000, "n_shards": 1}
+    for seed in range(2):
+        append_run(log, {**base, "tiled": False, "seed": seed, "image_auroc": 0.9 + seed / 100})
+        append_run(log, {**base, "tiled": True, "seed": seed, "image_auroc": 0.7})
+
+    res = build_report(tmp_path)
+    rows = _rows(res.table_csv)
+    assert res.n_groups == 2
+    assert {r["tiled"] for r in rows} == {"0", "1"}
+    assert all(r["n_runs"] == "2" for r in rows)
+    best = next(r for r in rows if r["tiled"] == "0")
+    assert float(best["image_auroc_mean"]) == 0.905
+
+
+def test_default_grouping_separates_projections(tmp_path: Path):
+    log = tmp_path / RUN_LOG_NAME
+    base = {"category": "bottle", "backbone": "resnet18", "bank_size": 1000, "proj_dim": 0}
+    for seed in range(2):
+        for proj, auc in [("none", 0.9), ("pca", 0.8)]:
+            append_run(log, {**base, "projection": proj, "seed": seed, "image_auroc": auc})
+
+    rows = _rows(build_report(tmp_path).table_csv)
+    assert sorted(r["projection"] for r in rows) == ["none", "pca"]
+    assert {r["projection"]: float(r["image_auroc_mean"]) for r in rows} == {
+        "none": 0.9,
+        "pca": 0.8,
+    }
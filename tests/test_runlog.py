@@ -0,0 +1,48 @@
+from pathlib import Path
+
+import numpy as np
+
+from metinspect.runlog import append_run, best_per, fingerprints, group_stats, load_runs
+
+
+def test_group_stats_across_seeds(tmp_path: Path):
+    log = tmp_path / "runs.jsonl"
+    for bb, vals in [("resnet18", [0.8, 0.9]), ("wide_resnet50_2", [0.95, 0.97])]:
+        for seed, v in enumerate(vals):
+            append_run(log, {"category": "metal_nut", "backbone": bb, "seed": seed, "auc": v})
+    append_run(log, {"category": "bottle", "backbone": "resnet18", "seed": 0})
+
+    cols = load_runs(log)
+    stats = group_stats(cols, ["category", "backbone"], ["auc"])
+    i = int(np.flatnonzero(stats["backbone"] == "resnet18")[1])
+    assert stats["category"][i] == "metal_nut"
+    assert np.isclose(stats["auc_mean"][i], 0.85)
+    assert np.isclose(stats["auc_std"][i], np.std([0.8, 0.9], ddof=1))
+
+    best = best_per(stats, "category", "auc_mean")
+    assert list(best["category"]) == ["bottle", "metal_nut"]
+    assert best["backbone"][1] == "wide_resnet50_2"
+
+    before = fingerprints(cols)
+    append_run(log, {"category": "bottle", "backbone": "resnet18", "seed": 1})
+    after = fingerprints(load_runs(log))
+    assert after["metal_nut"] == before["metal_nut"]
+    assert after["bottle"] != before["bottle"]
+
+
+def test_group_stats_pools_runs_missing_a_key(tmp_path: Path):
+    log = tmp_path / "runs.jsonl"
+    for seed in range(3):  # logged before proj_dim / projection existed
+        append_run(log, {"category": "bottle", "seed": seed, "auc": 0.8 + seed / 100})
+    for seed in range(2):
+        append_run(
+            log,
+            {"category": "bottle", "projection": "pca", "proj_dim": 64, "seed": seed, "auc": 0.9},
+        )
+
+    stats = group_stats(load_runs(log), ["category", "projection", "proj_dim"], ["auc"])
+    assert list(stats["n_runs"]) == [3.0, 2.0]
+    assert list(stats["projection"]) == ["", "pca"]
+    assert np.isnan(stats["proj_dim"][0]) and stats["proj_dim"][1] == 64
+    assert np.isclose(stats["auc_mean"][0], 0.81)
+    assert np.isclose(stats["auc_std"][0], 0.01)
@@ -0,0 +1,57 @@
+from pathlib import Path
+
+import cv2
+import numpy as np
+import torch
+from stub_backbone import StubPatchCore
+
+from metinspect.models.shared_bank import ScoringPool
+
+
+def _fit_and_write_images(tmp_path: Path, **kwargs) -> tuple[StubPatchCore, list[Path]]:
+    rng = np.random.default_rng(0)
+    pc = StubPatchCore("stub", image_size=32, **kwargs)
+    pc.fit_from_tensors(
+        (torch.from_numpy(rng.random((1, 3, 32, 32), dtype=np.float32)) for _ in range(4)),
+        max_patches=200,
+    )
+    paths = []
+    for j in range(3):
+        path = tmp_path / f"{j}.png"
+        cv2.imwrite(str(path), rng.integers(0, 256, (32, 32, 3), dtype=np.uint8))
+        paths.append(path)
+    return pc, paths
+
+
+def test_scoring_pool_matches_in_process(tmp_path):
+    pc, paths = _fit_and_write_images(tmp_path)
+    model_path = tmp_path / "model.pt"
+    pc.save(model_path)
+
+    with ScoringPool(
+        model_path, n_workers=2, threads_per_worker=1, model_cls=StubPatchCore
+    ) as pool:
+        assert pool.bank is not None
+        results = list(pool.score_paths(paths))
+
+    for path, (score, score_map) in zip(paths, results, strict=True):
+        ref_score, ref_map = pc.score_path(path)
+        assert np.isclose(score, ref_score, atol=1e-5)
+        assert np.allclose(score_map, ref_map, atol=1e-5)
+
+
+def test_scoring_pool_keeps_saved_mmap_shards(tmp_path):
+    pc, paths = _fit_and_write_images(tmp_path, n_shards=3)
+    model_path = tmp_path / "model.pt"
+    pc.save(model_path, mmap_bank=True)
+
+    # the override only applies to in-memory banks
+    with ScoringPool(
+        model_path, n_workers=2, threads_per_worker=2, n_shards=1, model_cls=StubPatchCore
+    ) as pool:
+        assert pool.bank is None
+        assert pool.n_shards == 3
+        results = list(pool.score_paths(paths))
+
+    for path, (score, _) in zip(paths, results, strict=True):
+        assert np.isclose(score, pc.score_path(path)[0], atol=1e-5)
@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+import torch
+from stub_backbone import StubPatchCore
+
+from metinspect.models.patchcore import _batched, _PatchReservoir
+from metinspect.tiling import TileStitcher, tile_grid, tile_origins
+
+
+def test_tile_origins_cover_extent():
+    assert tile_origins(100, 256, 192) == [0]
+    assert tile_origins(256, 256, 192) == [0]
+    origins = tile_origins(1000, 256, 192)
+    assert origins[0] == 0
+    assert origins[-1] == 1000 - 256
+
+
+def test_stitcher_constant_map_is_preserved():
+    h, w, tile = 300, 520, 128
+    st = TileStitcher(h, w, tile)
+    for y, x in tile_grid(h, w, tile, overlap=0.25):
+        st.add(y, x, np.full((tile, tile), 3.0, dtype=np.float32))
+    out = st.result()
+    assert out.shape == (h, w)
+    assert np.allclose(out, 3.0)
+
+
+@pytest.fixture(scope="module")
+def tiled_pc() -> StubPatchCore:
+    rng = np.random.default_rng(0)
+    pc = StubPatchCore("stub", image_size=32, tile_overlap=0.25)
+    images = [torch.from_numpy(rng.random((1, 3, 48, 40), dtype=np.float32)) for _ in range(3)]
+    pc.fit_from_tensors((t for x in images for t in pc.iter_tiles(x)), max_patches=300)
+    return pc
+
+
+@pytest.mark.parametrize("hw", [(20, 28), (40, 72)])
+def test_score_tiled_map_shape_and_max_tile_score(tiled_pc, hw):
+    x = torch.from_numpy(np.random.default_rng(1).random((1, 3, *hw), dtype=np.float32))
+    tiles = list(tiled_pc.iter_tiles(x))
+    assert all(t.shape[2:] == (32, 32) for t in tiles)
+    assert len(tiles) == len(tile_grid(*hw, 32, 0.25))
+
+    score, score_map = tiled_pc.score_tiled(x, batch_size=2)
+    assert score_map.shape == hw
+    assert np.isclose(score, max(tiled_pc.score(t)[0] for t in tiles), atol=1e-5)
+    assert score_map.max() <= score + 1e-5
+
+
+def test_batched_splits_on_size_and_shape():
+    ts = [torch.zeros(1, 3, 8, 8)] * 5 + [torch.zeros(1, 3, 4, 4)] * 2
+    shapes = [tuple(b.shape) for b in _batched(ts, 2)]
+    assert shapes == [(2, 3, 8, 8), (2, 3, 8, 8), (1, 3, 8, 8), (2, 3, 4, 4)]
+
+
+def test_reservoir_bounds_rows_and_keeps_short_streams():
+    np.random.seed(0)
+    stream = np.arange(1000, dtype=np.float32)[:, None]
+    res = _PatchReservoir(100)
+    for chunk in np.array_split(stream, 7):
+        res.add(chunk)
+    kept = res.result()
+    assert kept.shape == (100, 1)
+    assert len(np.unique(kept)) == 100
+
+    short = _PatchReservoir(100)
+    for chunk in np.array_split(stream[:30], 4):
+        short.add(chunk)
+    assert np.array_equal(short.result(), stream[:30])